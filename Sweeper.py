@@ -12,10 +12,35 @@ from os import environ
 from os.path import expanduser
 import os.path
 import sys
+import csv
+import json
 import datetime
+import sqlite3
+import threading
+import time
+import signal
+import mmap
+import tempfile
+from array import array
+from collections import namedtuple
+from functools import partial
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import urlparse, parse_qs
 import yaml
 import boto3
-from botocore.exceptions import ProfileNotFound, ClientError
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from dateutil.tz import tzutc
+from botocore.exceptions import ProfileNotFound, ClientError, UnknownServiceError, BotoCoreError
 
 def print_banner():
     """
@@ -41,17 +66,1438 @@ def show_usage():
     print("  -c <config file>, Yaml config file to load (loads default found in root file if not provided)")
     print("  -p <profile(s)>, AWS Profile(s) to use from credentials file. If ommited, Sweeper will use env vars. For more profile, pass a csv list (default1,default2)")
     print("  -o <file name>, Outputs results into a text file instead of std out")
+    print("  --jsonl <file name>, Also writes each finding as a JSON line to a file")
+    print("  --csv <file name>, Also writes each finding as a CSV row to a file")
+    print("  --inventory <file name>, SQLite inventory to cache resources and findings in between sweeps")
+    print("  --since-last, Only reports findings that are new or resolved since the last sweep")
+    print("  -j, --workers <n>, Number of (profile, region, check) units to sweep concurrently (default 1)")
+    print("  --stack-workers <n>, Number of Opsworks stack queries to run concurrently (default 1)")
+    print("  --rate <n>, Most API calls per second per profile, service and region (default 20)")
+    print("  --profile-report, Prints the slowest checks and API calls once the sweep is complete")
+    print("  --prometheus <file name>, Writes sweep timings and API call metrics as a Prometheus textfile")
+    print("  --discover-regions, Sweeps the regions enabled for each account instead of the built in list")
+    print("  --daemon, Keeps running, sweeping every --interval and/or on request to --listen")
+    print("  --interval <seconds>, How often the daemon sweeps on its own")
+    print("  --listen <host:port or socket path>, Local HTTP endpoint the daemon takes sweep requests on")
+    print("  --org-role <role name>, Sweeps every account in the AWS Organization by assuming this role in each")
+    print("  --time-budget <seconds>, Runs the most valuable checks first and skips what is left when time runs out")
+    print("  --spill <directory>, Keeps large resource collections in memory mapped files in this directory")
     print("  -h, displays this usage")
     sys.exit()
 
+# Resource collections checks can share, fetched at most once per (profile, region)
+# name: (service, operation, result key, call arguments, criteria)
+# criteria maps an item field to the values it must have, or None for a field that
+# must be missing or empty. They are pushed down to the API where it can filter on
+# them (see PUSHDOWN) and always checked in Python as well
+COLLECTIONS = {
+    'elb-idle-load-balancers': ('elb', 'describe_load_balancers', 'LoadBalancerDescriptions', {}, {
+        'Instances': None
+    }),
+    'ec2-available-volumes': ('ec2', 'describe_volumes', 'Volumes', {}, {
+        'State': ['available']
+    }),
+    'ec2-images': ('ec2', 'describe_images', 'Images', {'Owners': ['self']}, {
+        'State': ['available']
+    }),
+    'ec2-snapshots': ('ec2', 'describe_snapshots', 'Snapshots', {'OwnerIds': ['self']}, {
+        'State': ['completed']
+    }),
+    'ec2-unassociated-addresses': ('ec2', 'describe_addresses', 'Addresses', {}, {
+        'InstanceId': None
+    }),
+    'elasticbeanstalk-environments': ('elasticbeanstalk', 'describe_environments', 'Environments', {
+        'IncludeDeleted': False
+    }, {}),
+    'opsworks-stacks': ('opsworks', 'describe_stacks', 'Stacks', {}, {}),
+    'rds-instances': ('rds', 'describe_db_instances', 'DBInstances', {}, {}),
+    # Automated snapshots are removed along with their instance, so only these can be left behind
+    'rds-kept-snapshots': ('rds', 'describe_db_snapshots', 'DBSnapshots', {}, {
+        'SnapshotType': ['manual', 'awsbackup']
+    }),
+}
+
+# Criteria the APIs can filter on themselves: (service, operation, item field): filter name
+PUSHDOWN = {
+    ('ec2', 'describe_volumes', 'State'): 'status',
+    ('ec2', 'describe_images', 'State'): 'state',
+    ('ec2', 'describe_snapshots', 'State'): 'status',
+    ('rds', 'describe_db_snapshots', 'SnapshotType'): 'snapshot-type',
+}
+
+# S3 bucket checks: workers looking up bucket regions, and the most objects listed
+# in a bucket with no CloudWatch metrics before giving up on it
+S3_LOCATION_WORKERS = 16
+S3_LIST_LIMIT = 100000
+
+# Config of the client bucket regions are looked up with, with a connection per worker
+S3_LOCATION_CONFIG = Config(max_pool_connections=S3_LOCATION_WORKERS)
+
+# Fields each collection keeps once fetched, everything else in the response is
+# dropped as it streams in. A path through a list marked with [] keeps every
+# value under it
+FIELDS = {
+    'elb-idle-load-balancers': ['LoadBalancerName'],
+    'ec2-available-volumes': ['VolumeId'],
+    'ec2-images': ['BlockDeviceMappings[].Ebs.SnapshotId'],
+    'ec2-snapshots': ['SnapshotId'],
+    'ec2-unassociated-addresses': ['PublicIp'],
+    'elasticbeanstalk-environments': ['EnvironmentName'],
+    'opsworks-stacks': ['StackId'],
+    'rds-instances': ['DBInstanceIdentifier'],
+    'rds-kept-snapshots': ['DBSnapshotIdentifier', 'DBInstanceIdentifier'],
+}
+
+# Bytes a column of a collection holds in memory before it is spilled to disk
+# and memory mapped, when --spill gives a directory to spill to
+SPILL_BYTES = 1048576
+
+# Items of a stored collection read from the inventory at a time
+INVENTORY_BATCH = 1000
+
+# Per-stack Opsworks queries: (operation, result key, report line)
+OPSWORKS_QUERIES = [
+    ('describe_ecs_clusters', 'EcsClusters', "{} has {} running ECS Clusters"),
+    ('describe_elastic_ips', 'ElasticIps', "{} has {} EIP's"),
+    ('describe_instances', 'Instances', "{} has {} Ec2 instances running"),
+    ('describe_elastic_load_balancers', 'ElasticLoadBalancers', "{} has {} ELB's running"),
+    ('describe_rds_db_instances', 'RdsDbInstances', "{} has {} RDS instances running"),
+    ('describe_volumes', 'Volumes', "{} has {} EBS Volumes registered"),
+]
+
+# Error codes AWS uses when a call is throttled rather than refused
+THROTTLE_CODES = [
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'SlowDown',
+    'EC2ThrottledException',
+    'PriorRequestNotComplete',
+    'BandwidthLimitExceeded',
+]
+
+# Seconds before assuming a role that failed is tried again, e.g. by a daemon
+ROLE_RETRY_SECONDS = 300
+
+# Error codes AWS uses when an account cannot use a region at all
+DISABLED_REGION_CODES = [
+    'AuthFailure',
+    'InvalidClientTokenId',
+    'UnrecognizedClientException',
+    'OptInRequired',
+]
+
+# Rough monthly savings in USD of acting on one finding of each check, used to
+# put the most valuable checks first under a --time-budget. Set check_values in
+# the config file to override them
+CHECK_VALUES = {
+    'elb': 18.0,
+    'ebs-volumes': 8.0,
+    'ebs-snapshots': 0.5,
+    'ec2-eips': 3.6,
+    'elastic-beanstalk': 30.0,
+    'opsworks': 50.0,
+    'rds-snapshots': 2.0,
+    's3': 5.0,
+}
+
+# Seconds a check that has never been timed is expected to take, and findings it
+# is expected to find, until a sweep has timed it
+UNTIMED_SECONDS = 5.0
+UNTIMED_FINDINGS = 1.0
+
+# Options that are switches rather than taking a value
+FLAGS = ['--since-last', '--profile-report', '--discover-regions', '--daemon']
+
+# Checks in the order they are reported, keyed by their checks_to_exclude name,
+# with the resource collections each one reads
+CHECKS = [
+    ('elb', 'check_elbs', ['elb-idle-load-balancers']),
+    ('ebs-volumes', 'check_ebs_volumes', ['ec2-available-volumes']),
+    ('ebs-snapshots', 'check_snapshots', ['ec2-images', 'ec2-snapshots']),
+    ('ec2-eips', 'check_eips', ['ec2-unassociated-addresses']),
+    ('elastic-beanstalk', 'check_beanstalk_environments', ['elasticbeanstalk-environments']),
+    ('opsworks', 'check_opsworks', ['opsworks-stacks']),
+    ('rds-snapshots', 'check_rds_snapshots', ['rds-instances', 'rds-kept-snapshots']),
+    # Buckets are listed once per profile rather than through a collection
+    ('s3', 'check_s3_buckets', []),
+    # TODO more checks!
+]
+
+def paginate(client, operation, key, **kwargs):
+    """
+    Streams the items under key from each page of an API call in turn. Uses the
+    botocore paginator where the operation has one, otherwise follows the
+    NextToken/Marker of each response by hand
+    """
+    if client.can_paginate(operation):
+        for page in client.get_paginator(operation).paginate(**kwargs):
+            for item in page.get(key, []):
+                yield item
+        return
+
+    function = getattr(client, operation)
+    while True:
+        response = function(**kwargs)
+        for item in response.get(key, []):
+            yield item
+        token = [name for name in ('NextToken', 'Marker') if response.get(name)]
+        if not token:
+            return
+        kwargs[token[0]] = response[token[0]]
+
+def matches(item, criteria):
+    """
+    Checks an item against collection criteria
+    """
+    for field, values in criteria.items():
+        if values is None:
+            if item.get(field):
+                return False
+        elif item.get(field) not in values:
+            return False
+    return True
+
+# Field paths split into their (key, is a list) steps, on first use
+PATHS = {}
+
+def walk(value, steps, start, found):
+    """
+    Follows the steps of a field path from start, adding every value reached to found
+    """
+    for index in range(start, len(steps)):
+        if not isinstance(value, dict):
+            return
+        name, many = steps[index]
+        value = value.get(name)
+        if many:
+            for element in value or ():
+                walk(element, steps, index + 1, found)
+            return
+    if value is not None:
+        found.append(str(value))
+
+def pluck(item, path):
+    """
+    Returns the value at a dotted path of an item as a string, empty if it is
+    missing, or a list of every value under a path through a list marked with []
+    """
+    if '.' not in path and '[]' not in path:
+        value = item.get(path)
+        return '' if value is None else str(value)
+    steps = PATHS.get(path)
+    if steps is None:
+        steps = PATHS[path] = [(part[:-2], True) if part.endswith('[]') else (part, False)
+                               for part in path.split('.')]
+    found = []
+    walk(item, steps, 0, found)
+    if '[]' in path:
+        return found
+    return found[0] if found else ''
+
+def count(items):
+    """
+    Counts the items of a stream without holding them
+    """
+    return sum(1 for _ in items)
+
+class RateLimiter(object):
+    """
+    Token bucket per (profile, service, region) that paces every API call attempt.
+    Each throttle halves that bucket's rate and each successful call wins a little
+    back, so a sweep settles just below the API's limits instead of failing
+    """
+    def __init__(self, rate=20.0, minimum=0.5, budget=None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.minimum = minimum
+        # A TimeBudget whose deadline no wait goes past
+        self.budget = budget
+        # key: [calls per second, tokens, last refill]
+        self.buckets = {}
+        self.throttles = 0
+        self.waited = 0.0
+
+    def attach(self, client, key):
+        """
+        Hooks the limiter into a client's attempts and retry decisions
+        """
+        client.meta.events.register('before-send', partial(self.before_send, key))
+        client.meta.events.register('needs-retry', partial(self.after_attempt, key))
+
+    def before_send(self, key, **kwargs):
+        """
+        Takes a token for the attempt, waiting for one if the bucket is empty
+        """
+        with self.lock:
+            now = time.time()
+            bucket = self.buckets.setdefault(key, [self.rate, self.rate, now])
+            bucket[1] = min(bucket[0], bucket[1] + (now - bucket[2]) * bucket[0]) - 1
+            bucket[2] = now
+            # Tokens are reserved up front, so waiting callers queue in turn
+            wait = -bucket[1] / bucket[0] if bucket[1] < 0 else 0
+            if wait and self.budget is not None and self.budget.deadline is not None:
+                wait = max(0, min(wait, self.budget.deadline - now))
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+    def after_attempt(self, key, response=None, caught_exception=None, **kwargs):
+        """
+        Slows the bucket down on a throttle and speeds it back up on a success.
+        Retrying is left to botocore
+        """
+        if caught_exception is not None or response is None:
+            return
+        code = response[1].get('Error', {}).get('Code')
+        with self.lock:
+            bucket = self.buckets[key]
+            if code in THROTTLE_CODES:
+                self.throttles += 1
+                bucket[0] = max(self.minimum, bucket[0] / 2)
+            elif code is None:
+                bucket[0] = min(self.rate, bucket[0] + 0.1)
+
+class OutOfTime(Exception):
+    """
+    Raised by API calls made once a sweep's time budget has run out
+    """
+    pass
+
+class TimeBudget(object):
+    """
+    Ends a sweep at its deadline. Any API call or retry attempted after it raises
+    OutOfTime, so units still running stop at their next attempt rather than running on
+    """
+    def __init__(self):
+        self.deadline = None
+
+    def attach(self, client, key):
+        """
+        Hooks the deadline into a client's calls and each attempt they make.
+        It is attached after the rate limiter, so an attempt that waited up to
+        the deadline is stopped
+        """
+        client.meta.events.register('before-parameter-build', self.before_call)
+        client.meta.events.register('before-send', self.before_call)
+
+    def expired(self):
+        """
+        Whether there is a deadline and it has passed
+        """
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def before_call(self, **kwargs):
+        """
+        Stops a call or attempt from being made after the deadline
+        """
+        if self.expired():
+            raise OutOfTime("The time budget ran out")
+
+class Instruments(object):
+    """
+    Records the wall time of each (profile, region, check) unit, and the calls,
+    errors, latency and response bytes of each API operation from botocore events
+    on the pooled clients
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.units = {}
+        # (service, operation): [calls, errors, seconds, bytes]
+        self.operations = {}
+
+    def attach(self, client, key):
+        """
+        Hooks the instruments into a client's calls
+        """
+        client.meta.events.register('before-parameter-build', self.before_call)
+        # Attached after the rate limiter, so its waits are not counted as latency
+        client.meta.events.register('before-send', self.before_send)
+        client.meta.events.register('needs-retry', self.after_attempt)
+        client.meta.events.register('after-call', self.after_call)
+        client.meta.events.register('after-call-error', self.after_call_error)
+
+    def before_call(self, model, context=None, **kwargs):
+        """
+        Notes the operation in its request context
+        """
+        if context is not None:
+            context['sweeper_operation'] = (model.service_model.service_name, model.name)
+            context['sweeper_seconds'] = 0.0
+
+    def before_send(self, request, **kwargs):
+        """
+        Notes when an attempt was sent
+        """
+        request.context['sweeper_sent'] = time.time()
+
+    def after_attempt(self, request_dict, **kwargs):
+        """
+        Adds an attempt's round trip to its call's latency, leaving out the
+        time spent backing off between attempts
+        """
+        context = request_dict['context']
+        sent = context.pop('sweeper_sent', None)
+        if sent is not None:
+            context['sweeper_seconds'] = context.get('sweeper_seconds', 0.0) + time.time() - sent
+
+    def after_call(self, context=None, http_response=None, **kwargs):
+        """
+        Records a call that got a response, including the attempts it retried
+        """
+        size = 0
+        if http_response is not None and http_response.raw is not None:
+            size = len(http_response.content)
+        failed = http_response is not None and http_response.status_code >= 300
+        self.record_call(context, failed, size)
+
+    def after_call_error(self, exception, context=None, **kwargs):
+        """
+        Records a call that raised rather than getting a response, such as one
+        that could not connect. A call stopped by the time budget is not an error
+        """
+        if not isinstance(exception, OutOfTime):
+            self.record_call(context, True, 0)
+
+    def record_call(self, context, failed, size):
+        """
+        Adds a finished call to its operation's totals
+        """
+        context = context or {}
+        key = context.get('sweeper_operation')
+        if key is None:
+            return
+        elapsed = context.get('sweeper_seconds', 0.0)
+        with self.lock:
+            operation = self.operations.setdefault(key, [0, 0, 0.0, 0])
+            operation[0] += 1
+            operation[1] += 1 if failed else 0
+            operation[2] += elapsed
+            operation[3] += size
+
+    def record_unit(self, unit, seconds):
+        """
+        Records how long a unit took
+        """
+        with self.lock:
+            self.units[(unit.profile, unit.region, unit.check)] = seconds
+
+    def report(self, limit=10):
+        """
+        Returns the slowest units and API operations as lines of text
+        """
+        lines = ["Slowest checks (profile, region, check):"]
+        units = sorted(self.units.items(), key=lambda item: item[1], reverse=True)
+        for (profile, region, check), seconds in units[:limit]:
+            lines.append("  {:>8.2f}s  {} {} {}".format(seconds, profile, region, check))
+        lines.append("Slowest API operations (by total time):")
+        operations = sorted(self.operations.items(), key=lambda item: item[1][2], reverse=True)
+        for (service, name), (calls, errors, seconds, size) in operations[:limit]:
+            lines.append("  {:>8.2f}s  {}.{}: {} calls, {} errors, {:.0f}ms average, {:.1f} KiB".format(
+                seconds,
+                service,
+                name,
+                calls,
+                errors,
+                seconds / calls * 1000,
+                size / 1024.0)
+            )
+        return lines
+
+    def write_prometheus(self, path, gauges):
+        """
+        Writes every metric in the Prometheus text format, along with the given
+        sweep-wide gauges. The file is replaced in one go so a collector never
+        reads it half written
+        """
+        def labels(**values):
+            return ','.join('{}="{}"'.format(
+                name,
+                str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            ) for name, value in sorted(values.items()))
+
+        lines = []
+        for name, value in sorted(gauges.items()):
+            lines.append('# TYPE sweeper_{} gauge'.format(name))
+            lines.append('sweeper_{} {}'.format(name, value))
+        lines.append('# TYPE sweeper_unit_duration_seconds gauge')
+        for (profile, region, check), seconds in sorted(self.units.items()):
+            lines.append('sweeper_unit_duration_seconds{{{}}} {}'.format(
+                labels(profile=profile, region=region, check=check), seconds))
+        for index, metric in enumerate([
+                'api_calls_total', 'api_errors_total', 'api_latency_seconds_total', 'api_response_bytes_total']):
+            lines.append('# TYPE sweeper_{} counter'.format(metric))
+            for (service, name), values in sorted(self.operations.items()):
+                lines.append('sweeper_{}{{{}}} {}'.format(
+                    metric, labels(service=service, operation=name), values[index]))
+
+        with open(path + '.tmp', 'w') as stream:
+            stream.write('\n'.join(lines) + '\n')
+        os.rename(path + '.tmp', path)
+
+class ClientPool(object):
+    """
+    Keeps one session per profile and one client per (profile, service, region)
+    so credentials, service models and keep-alive connections are reused. Clients
+    are thread safe once built, but sessions are not, and building one may assume
+    a role, so each profile's session and clients are built under its own lock
+    """
+    def __init__(self, max_connections=10, hooks=None):
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.sessions = {}
+        self.clients = {}
+        # Assumes roles for Organization member accounts, which are used as profiles
+        self.roles = None
+        # Objects with an attach(client, key) method, such as the rate limiter
+        self.hooks = hooks or []
+        self.config = Config(
+            max_pool_connections=max(10, max_connections),
+            retries={'max_attempts': 10, 'mode': 'standard'}
+        )
+
+    def lock_for(self, profile):
+        """
+        Returns the lock a profile's session and clients are built under
+        """
+        with self.lock:
+            return self.locks.setdefault(profile, threading.Lock())
+
+    def session(self, profile):
+        """
+        Returns the session for a profile, creating it on first use. Callers
+        from more than one thread hold the profile's lock
+        """
+        if profile not in self.sessions:
+            if self.roles and profile in self.roles.accounts:
+                session = self.roles.session(profile)
+            elif profile:
+                session = boto3.Session(profile_name=profile)
+            else:
+                session = boto3.Session()
+            with self.lock:
+                self.sessions[profile] = session
+        return self.sessions[profile]
+
+    def client(self, service, region, profile=None, config=None):
+        """
+        Returns the shared client for a service in a region, creating it on first use.
+        A client with its own config, merged over the pool's, is kept apart from the
+        shared one but gets the same hooks
+        """
+        key = (profile, service, region)
+        entry = key if config is None else key + (config,)
+        with self.lock:
+            if entry in self.clients:
+                return self.clients[entry]
+        with self.lock_for(profile):
+            with self.lock:
+                if entry in self.clients:
+                    return self.clients[entry]
+            client = self.session(profile).client(
+                service,
+                region_name=region,
+                config=self.config if config is None else self.config.merge(config)
+            )
+            for hook in self.hooks:
+                hook.attach(client, key)
+            with self.lock:
+                self.clients[entry] = client
+            return client
+
+class RegionFinder(object):
+    """
+    Finds the regions each profile's account has enabled with describe_regions,
+    kept in a JSON file for ttl seconds, and drops any that fail a quick pre-flight
+    call. The pre-flight is made once per profile per sweep rather than per check,
+    so a region that only timed out once is tried again on the next sweep. Profiles
+    can be discovered from several threads at once
+    """
+    def __init__(self, pool, path, ttl=86400):
+        self.pool = pool
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.reachable = {}
+        self.dropped = {}
+        # Pre-flight clients are kept in the pool for later sweeps under this config
+        self.config = Config(
+            connect_timeout=3,
+            read_timeout=5,
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
+        try:
+            with open(path) as stream:
+                self.known = json.load(stream)
+        except (IOError, ValueError):
+            self.known = {}
+
+    def reset(self):
+        """
+        Forgets the pre-flight results, so the next sweep probes every region again
+        """
+        self.reachable = {}
+
+    def regions(self, profile):
+        """
+        Returns the usable regions for a profile, or None if they can't be discovered
+        """
+        if profile not in self.reachable:
+            enabled = self.enabled(profile)
+            if enabled is None:
+                return None
+            self.reachable[profile] = self.preflight(profile, enabled)
+        return self.reachable[profile]
+
+    def enabled(self, profile):
+        """
+        Returns the regions enabled for the account, from the file while within the ttl
+        """
+        known = self.known.get(profile or '')
+        if known and 'enabled' in known and known['fetched'] >= time.time() - self.ttl:
+            return known['enabled']
+        try:
+            response = self.pool.client('ec2', 'us-east-1', profile).describe_regions(AllRegions=True)
+        except (ClientError, BotoCoreError, OutOfTime):
+            return None
+        enabled = sorted(
+            region['RegionName'] for region in response['Regions']
+            if region.get('OptInStatus') != 'not-opted-in'
+        )
+        with self.lock:
+            self.known[profile or ''] = {'fetched': time.time(), 'enabled': enabled}
+            try:
+                with open(self.path, 'w') as stream:
+                    json.dump(self.known, stream, indent=2, sort_keys=True)
+            except IOError as err:
+                print("WARN: Unable to save discovered regions to {}: {}".format(self.path, err))
+        return enabled
+
+    def preflight(self, profile, enabled):
+        """
+        Probes the enabled regions concurrently and keeps those that answer
+        """
+        clients = [self.pool.client('ec2', region, profile, self.config) for region in enabled]
+        executor = ThreadPoolExecutor(max_workers=max(1, min(len(clients), 16)))
+        try:
+            answers = list(executor.map(self.probe, clients))
+        finally:
+            executor.shutdown(wait=True)
+        self.dropped[profile] = [region for region, answer in zip(enabled, answers) if not answer]
+        return [region for region, answer in zip(enabled, answers) if answer]
+
+    @staticmethod
+    def probe(client):
+        """
+        Makes one cheap call in a region, returning False if it is unreachable or disabled.
+        A call that is only refused for lack of permission still counts as an answer, and
+        a region is kept if the time budget ran out, so its checks are reported as skipped
+        """
+        try:
+            client.describe_availability_zones()
+        except OutOfTime:
+            return True
+        except ClientError as err:
+            return err.response.get('Error', {}).get('Code') not in DISABLED_REGION_CODES
+        except BotoCoreError:
+            return False
+        return True
+
+class RoleCredentials(object):
+    """
+    Assumes a role in each member account of an AWS Organization from the
+    management session. Each account gets one session, shared by every region
+    and check, whose credentials botocore refreshes shortly before they expire
+    """
+    def __init__(self, session, role, session_name='Sweeper', duration=3600):
+        self.management = session
+        self.role = role
+        self.session_name = session_name
+        self.duration = duration
+        self.partition = session.get_partition_for_region(session.region_name or 'us-east-1')
+        self.sts = session.client('sts')
+        self.accounts = {}
+        self.failed = {}
+        self.assumed = 0
+        # Guards the count of roles assumed, which refreshes add to from other threads
+        self.lock = threading.Lock()
+
+    def list_accounts(self, exclude=None):
+        """
+        Finds the active member accounts, as a list of account ids
+        """
+        client = self.management.client('organizations', region_name='us-east-1')
+        for account in paginate(client, 'list_accounts', 'Accounts'):
+            if account['Status'] == 'ACTIVE' and account['Id'] not in (exclude or []):
+                self.accounts[account['Id']] = account['Name']
+        return sorted(self.accounts)
+
+    def assume(self, account):
+        """
+        Assumes the role in an account, returning credentials in botocore's format
+        """
+        response = self.sts.assume_role(
+            RoleArn='arn:{}:iam::{}:role/{}'.format(self.partition, account, self.role),
+            RoleSessionName=self.session_name,
+            DurationSeconds=self.duration
+        )
+        with self.lock:
+            self.assumed += 1
+        credentials = response['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
+        }
+
+    def session(self, account):
+        """
+        Returns a new session for an account. The role is assumed straight away, so
+        an account the role can't be assumed in fails fast, without calling STS
+        again, until ROLE_RETRY_SECONDS have passed
+        """
+        if account in self.failed:
+            err, retry_after = self.failed[account]
+            if time.time() < retry_after:
+                raise err
+            del self.failed[account]
+        try:
+            metadata = self.assume(account)
+        except ClientError as err:
+            self.failed[account] = (err, time.time() + ROLE_RETRY_SECONDS)
+            raise
+        credentials = RefreshableCredentials.create_from_metadata(
+            metadata,
+            partial(self.assume, account),
+            'assume-role'
+        )
+        session = botocore.session.get_session()
+        # botocore has no public setter for a session's credentials
+        session._credentials = credentials
+        # Every account shares the management session's loader, so service models
+        # are loaded once rather than once per account
+        loader = self.management._session.get_component('data_loader')
+        session.register_component('data_loader', loader)
+        with self.lock:
+            paths = list(loader.search_paths)
+            account_session = boto3.Session(botocore_session=session, region_name=self.management.region_name)
+            # boto3 adds its resource models to the loader's paths for each session
+            loader.search_paths[:] = paths
+        return account_session
+
+class Inventory(object):
+    """
+    On-disk SQLite store of the resource collections fetched and the findings of
+    the last sweep, keyed by profile, region and collection or check. Collections
+    are served back while they are younger than their TTL in seconds, and are
+    stored and read an item at a time so they are never held whole as dicts
+    """
+    def __init__(self, path, ttl=0, ttls=None):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS fetches ('
+                'profile TEXT, region TEXT, name TEXT, fetched REAL, '
+                'PRIMARY KEY (profile, region, name))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                'profile TEXT, region TEXT, name TEXT, position INTEGER, item TEXT, '
+                'PRIMARY KEY (profile, region, name, position))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS findings ('
+                'profile TEXT, region TEXT, check_name TEXT, resource_id TEXT, reason TEXT, '
+                'PRIMARY KEY (profile, region, check_name, resource_id))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS timings ('
+                'profile TEXT, region TEXT, check_name TEXT, seconds REAL, findings REAL, '
+                'PRIMARY KEY (profile, region, check_name))'
+            )
+
+    def keeps(self, name):
+        """
+        Whether a collection has a TTL, so is worth storing to be served back
+        """
+        return self.ttls.get(name, self.ttl) > 0
+
+    def load(self, profile, region, name):
+        """
+        Returns an iterator over a stored collection's items if it is still within
+        its TTL, otherwise None
+        """
+        ttl = self.ttls.get(name, self.ttl)
+        if ttl <= 0:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT fetched FROM fetches WHERE profile = ? AND region = ? AND name = ? AND fetched >= ?',
+                (profile or '', region, name, time.time() - ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        return self.items(profile, region, name)
+
+    def items(self, profile, region, name):
+        """
+        Streams a stored collection's items, INVENTORY_BATCH at a time, so other
+        threads can use the inventory in between
+        """
+        position = -1
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT position, item FROM items WHERE profile = ? AND region = ? AND name = ? AND position > ? '
+                    'ORDER BY position LIMIT ?',
+                    (profile or '', region, name, position, INVENTORY_BATCH)
+                ).fetchall()
+            for position, item in rows:
+                yield json.loads(item)
+            if len(rows) < INVENTORY_BATCH:
+                return
+
+    def save(self, profile, region, name, items):
+        """
+        Stores a freshly fetched collection, replacing the one stored before
+        """
+        key = (profile or '', region, name)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM items WHERE profile = ? AND region = ? AND name = ?', key)
+            self.connection.executemany(
+                'INSERT INTO items VALUES (?, ?, ?, ?, ?)',
+                (key + (position, json.dumps(item, default=str)) for position, item in enumerate(items))
+            )
+            self.connection.execute('INSERT OR REPLACE INTO fetches VALUES (?, ?, ?, ?)', key + (time.time(),))
+
+    def findings(self, profile, region, check):
+        """
+        Returns the last sweep's findings for a check as resource id: reason
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT resource_id, reason FROM findings WHERE profile = ? AND region = ? AND check_name = ?',
+                (profile or '', region, check)
+            ).fetchall()
+        return dict(rows)
+
+    def save_findings(self, profile, region, check, findings):
+        """
+        Replaces the stored findings for a check with this sweep's
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM findings WHERE profile = ? AND region = ? AND check_name = ?',
+                (profile or '', region, check)
+            )
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO findings VALUES (?, ?, ?, ?, ?)',
+                [(profile or '', region, check, str(finding.resource_id), finding.reason) for finding in findings]
+            )
+
+    def timings(self):
+        """
+        Returns the average seconds and findings of every check timed so far,
+        keyed by (profile, region, check)
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT profile, region, check_name, seconds, findings FROM timings'
+            ).fetchall()
+        return dict(((profile, region, check), (seconds, findings)) for profile, region, check, seconds, findings in rows)
+
+    def save_timing(self, profile, region, check, seconds, findings, cut_off=False):
+        """
+        Folds a check's time and findings into its moving averages, weighting
+        this sweep as much as all of the previous ones. A check that was cut off
+        takes longer than it ran, so that time is added to what it was expected to
+        take, and a check cut off again and again makes way for the others
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT seconds, findings FROM timings WHERE profile = ? AND region = ? AND check_name = ?',
+                (profile or '', region, check)
+            ).fetchone()
+            if cut_off:
+                if row is not None:
+                    seconds = row[0] + seconds
+                    findings = max(row[1], findings)
+            elif row is not None:
+                seconds = (row[0] + seconds) / 2.0
+                findings = (row[1] + findings) / 2.0
+            self.connection.execute(
+                'INSERT OR REPLACE INTO timings VALUES (?, ?, ?, ?, ?)',
+                (profile or '', region, check, seconds, findings)
+            )
+
+    def close(self):
+        """
+        Closes the inventory database
+        """
+        self.connection.close()
+
+class PackedStrings(object):
+    """
+    A column of strings packed end to end into one buffer, with an array of where
+    each one ends, instead of a string object each. With a spill directory, a
+    buffer that grows past SPILL_BYTES moves to a temporary file which is memory
+    mapped once the column is complete
+    """
+    def __init__(self, spill=None):
+        self.spill = spill
+        self.ends = array('L')
+        self.buffer = bytearray()
+        self.file = None
+        self.size = 0
+
+    def append(self, value):
+        """
+        Adds a string to the end of the column
+        """
+        data = value.encode('utf-8')
+        self.size += len(data)
+        self.ends.append(self.size)
+        if self.file:
+            self.file.write(data)
+            return
+        self.buffer += data
+        if self.spill and len(self.buffer) > SPILL_BYTES:
+            self.file = tempfile.TemporaryFile(dir=self.spill)
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+    def finish(self):
+        """
+        Maps a spilled column back in, read only, once every string is added
+        """
+        if self.file:
+            self.file.flush()
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def raw(self, index):
+        """
+        Returns a string of the column as bytes
+        """
+        start = self.ends[index - 1] if index else 0
+        return bytes(self.buffer[start:self.ends[index]])
+
+    def raws(self):
+        """
+        Yields every string of the column as bytes, in order
+        """
+        start = 0
+        for end in self.ends:
+            yield bytes(self.buffer[start:end])
+            start = end
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, index):
+        return self.raw(index).decode('utf-8')
+
+    def __iter__(self):
+        for data in self.raws():
+            yield data.decode('utf-8')
+
+    def close(self):
+        """
+        Unmaps and removes a spilled column
+        """
+        if self.file:
+            self.buffer.close()
+            self.file.close()
+
+class Stream(object):
+    """
+    A resource collection with a single reader, read once straight from the API
+    as it is paged through. It has the same methods for checks as Columns
+    """
+    def __init__(self, items):
+        self.items = items
+
+    def values(self, field):
+        """
+        Yields every value of a field, in order
+        """
+        return (pluck(item, field) for item in self.items)
+
+    def keys(self, field):
+        """
+        Returns the set of values of a field, to join other collections against
+        """
+        if '[]' in field:
+            return set(value for item in self.items for value in pluck(item, field))
+        return set(self.values(field))
+
+    def anti_join(self, field, keys, result):
+        """
+        Yields the result field of every item whose field is not one of the keys
+        """
+        for item in self.items:
+            if pluck(item, field) not in keys:
+                yield pluck(item, result)
+
+    def close(self):
+        """
+        Nothing is held
+        """
+        pass
+
+class Columns(object):
+    """
+    A resource collection that is shared or stored, held as a packed column for
+    each of its FIELDS rather than as the response dicts. Joins against it
+    compare the packed bytes, so only the items that are reported are decoded
+    """
+    def __init__(self, fields, items=(), spill=None):
+        self.fields = fields
+        self.count = 0
+        self.columns = dict((field, PackedStrings(spill)) for field in fields)
+        # How many values each item has in a field through a list
+        self.lengths = dict((field, array('L')) for field in fields if '[]' in field)
+        for item in items:
+            self.append(item)
+        for column in self.columns.values():
+            column.finish()
+
+    def append(self, item):
+        """
+        Adds the fields of a response item, or of a row read back from the inventory
+        """
+        for field in self.fields:
+            if field in item and ('.' in field or '[]' in field):
+                # A row read back from the inventory, keyed by the path it was plucked from
+                value = item[field]
+            else:
+                value = pluck(item, field)
+            if field in self.lengths:
+                self.lengths[field].append(len(value))
+                for element in value:
+                    self.columns[field].append(element)
+            else:
+                self.columns[field].append(value)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """
+        Yields each item as a dict of its fields, e.g. to be stored in the inventory
+        """
+        values = dict((field, iter(column)) for field, column in self.columns.items())
+        for index in range(self.count):
+            row = {}
+            for field in self.fields:
+                if field in self.lengths:
+                    row[field] = [next(values[field]) for _ in range(self.lengths[field][index])]
+                else:
+                    row[field] = next(values[field])
+            yield row
+
+    def values(self, field):
+        """
+        Yields every value of a field, in order
+        """
+        return iter(self.columns[field])
+
+    def keys(self, field):
+        """
+        Returns the set of values of a field, to join other collections against
+        """
+        return set(self.columns[field])
+
+    def anti_join(self, field, keys, result):
+        """
+        Yields the result field of every item whose field is not one of the keys
+        """
+        keys = set(key.encode('utf-8') for key in keys)
+        results = self.columns[result]
+        for index, data in enumerate(self.columns[field].raws()):
+            if data not in keys:
+                yield results[index]
+
+    def close(self):
+        """
+        Releases any spilled columns
+        """
+        for column in self.columns.values():
+            column.close()
+
+class ResourceCache(object):
+    """
+    Fetches each resource collection once per (profile, region) and shares it
+    between the checks that declared it. A collection is dropped once every unit
+    planned to read it has run, and one with a single reader is streamed straight
+    through rather than held. Held collections are packed into Columns. With an
+    inventory, fresh collections are served from disk and everything fetched is stored
+    """
+    def __init__(self, create_client, inventory=None, spill=None):
+        self.create_client = create_client
+        self.inventory = inventory
+        self.spill = spill
+        self.lock = threading.Lock()
+        self.readers = {}
+        self.entries = {}
+        self.locks = {}
+        self.fetches = 0
+        self.hits = 0
+        self.stored = 0
+
+    def plan(self, profile, region, collections):
+        """
+        Registers a unit that will read the given collections
+        """
+        with self.lock:
+            for name in collections:
+                key = (profile, region, name)
+                self.readers[key] = self.readers.get(key, 0) + 1
+
+    def release(self, profile, region, collections):
+        """
+        Marks a unit as done with its collections, dropping any no longer needed
+        """
+        with self.lock:
+            for name in collections:
+                key = (profile, region, name)
+                self.readers[key] = self.readers.get(key, 0) - 1
+                if self.readers[key] <= 0:
+                    del self.readers[key]
+                    if key in self.entries:
+                        self.entries.pop(key).close()
+                    self.locks.pop(key, None)
+
+    def clear(self):
+        """
+        Forgets every planned reader and held collection, after a sweep was cut short
+        """
+        with self.lock:
+            self.readers.clear()
+            for items in self.entries.values():
+                items.close()
+            self.entries.clear()
+            self.locks.clear()
+
+    def stream(self, profile, region, name):
+        """
+        Streams a collection from the API, filtered by its criteria server side
+        where the API supports it and in Python otherwise
+        """
+        service, operation, key, kwargs, criteria = COLLECTIONS[name]
+        filters = [
+            {'Name': PUSHDOWN[(service, operation, field)], 'Values': values}
+            for field, values in sorted(criteria.items())
+            if values and (service, operation, field) in PUSHDOWN
+        ]
+        if filters:
+            kwargs = dict(kwargs, Filters=kwargs.get('Filters', []) + filters)
+        client = self.create_client(service, region, profile)
+        items = paginate(client, operation, key, **kwargs)
+        if not criteria:
+            return items
+        return (item for item in items if matches(item, criteria))
+
+    def fetch(self, profile, region, name, hold):
+        """
+        Fetches a collection from the inventory while it is fresh, otherwise from
+        the API. It is only held, as Columns, when it is shared or being stored.
+        Collections without a TTL are never served back, so are not stored
+        """
+        store = self.inventory is not None and self.inventory.keeps(name)
+        if store:
+            items = self.inventory.load(profile, region, name)
+            if items is not None:
+                with self.lock:
+                    self.stored += 1
+                return Columns(FIELDS[name], items, self.spill)
+
+        items = self.stream(profile, region, name)
+        if store or hold:
+            items = Columns(FIELDS[name], items, self.spill)
+            if store:
+                self.inventory.save(profile, region, name, items)
+        else:
+            items = Stream(items)
+        with self.lock:
+            self.fetches += 1
+        return items
+
+    def get(self, profile, region, name):
+        """
+        Returns a collection, fetching it unless another unit already has
+        """
+        key = (profile, region, name)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            fetch_lock = None
+            if self.readers.get(key, 0) > 1:
+                fetch_lock = self.locks.setdefault(key, threading.Lock())
+
+        if fetch_lock is None:
+            return self.fetch(profile, region, name, False)
+
+        # Readers arriving while the collection is being fetched wait for it
+        with fetch_lock:
+            with self.lock:
+                if key in self.entries:
+                    self.hits += 1
+                    return self.entries[key]
+            items = self.fetch(profile, region, name, True)
+            with self.lock:
+                self.entries[key] = items
+            return items
+
+# A single structured result, as written to the JSON Lines and CSV sinks
+# status is 'current', 'new'/'resolved' when only changes since the last sweep are reported,
+# or 'skipped' for a check the time budget ran out before it finished
+Finding = namedtuple('Finding', ['profile', 'region', 'check', 'resource_id', 'reason', 'status'])
+
+class TextSink(object):
+    """
+    Writes the human readable report, to screen or to a file as it is produced
+    """
+    def __init__(self, file_name=None):
+        self.stream = open(file_name, 'w') if file_name else sys.stdout
+
+    def line(self, string):
+        """
+        Writes a line of the report
+        """
+        self.stream.write('{}\n'.format(string))
+
+    def finding(self, finding):
+        """
+        Findings are already part of the report text
+        """
+        pass
+
+    def flush(self):
+        """
+        Writes out what is buffered of the report
+        """
+        self.stream.flush()
+
+    def close(self):
+        """
+        Closes the report file, if there is one
+        """
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+class FileSink(object):
+    """
+    Base of the sinks that write findings to a file, leaving out the report text
+    """
+    def __init__(self, file_name):
+        self.stream = open(file_name, 'w')
+
+    def line(self, string):
+        """
+        Report text is not written to structured sinks
+        """
+        pass
+
+    def finding(self, finding):
+        """
+        Writes a finding, in the sink's format
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Writes out what is buffered of the findings file
+        """
+        self.stream.flush()
+
+    def close(self):
+        """
+        Closes the findings file
+        """
+        self.stream.close()
+
+class JsonLinesSink(FileSink):
+    """
+    Writes each finding to a file as a JSON object per line
+    """
+    def finding(self, finding):
+        """
+        Writes a finding as a JSON line
+        """
+        self.stream.write(json.dumps(finding._asdict()))
+        self.stream.write('\n')
+
+class CsvSink(FileSink):
+    """
+    Writes each finding to a file as a CSV row, after a header row
+    """
+    def __init__(self, file_name):
+        super(CsvSink, self).__init__(file_name)
+        self.writer = csv.writer(self.stream, lineterminator='\n')
+        self.writer.writerow(Finding._fields)
+
+    def finding(self, finding):
+        """
+        Writes a finding as a CSV row
+        """
+        self.writer.writerow(finding)
+
+class MemorySink(object):
+    """
+    Keeps the findings of one sweep in memory, for the daemon to return
+    """
+    def __init__(self):
+        self.findings = []
+
+    def line(self, string):
+        """
+        Report text is not kept
+        """
+        pass
+
+    def finding(self, finding):
+        """
+        Keeps a finding
+        """
+        self.findings.append(finding._asdict())
+
+    def flush(self):
+        """
+        Nothing is buffered
+        """
+        pass
+
+    def close(self):
+        """
+        Nothing to close
+        """
+        pass
+
+class SweepHandler(BaseHTTPRequestHandler):
+    """
+    Serves the daemon's endpoints. GET /health reports on the daemon, GET /last
+    returns the last sweep and GET or POST /sweep runs a sweep straight away and
+    returns its results. /sweep takes optional profiles and checks csv lists,
+    which may only name configured profiles and known checks
+    """
+    def do_GET(self):
+        """
+        Routes a request to its endpoint and answers with JSON
+        """
+        url = urlparse(self.path)
+        sweeper = self.server.sweeper
+        if url.path == '/health':
+            self.send_json(200, {
+                'status': 'ok',
+                'sweeps': sweeper.sweeps,
+                'last_sweep': sweeper.last and sweeper.last['started']
+            })
+        elif url.path == '/last':
+            self.send_json(200, sweeper.last or {})
+        elif url.path == '/sweep':
+            query = parse_qs(url.query)
+            profiles = [p for p in ','.join(query.get('profiles', [])).split(',') if p]
+            checks = [c for c in ','.join(query.get('checks', [])).split(',') if c]
+            unknown = [p for p in profiles if p not in sweeper.profile_list] + \
+                      [c for c in checks if c not in [name for name, _, _ in CHECKS]]
+            if unknown:
+                self.send_json(400, {'error': 'Unknown profiles or checks: {}'.format(', '.join(unknown))})
+                return
+            try:
+                result = sweeper.sweep(profiles, checks, collect=True)
+            except Exception as err:
+                self.send_json(500, {'error': str(err)})
+            else:
+                self.send_json(200, result)
+        else:
+            self.send_json(404, {'error': 'Unknown endpoint {}'.format(url.path)})
+
+    do_POST = do_GET
+
+    def send_json(self, status, body):
+        """
+        Writes a JSON response
+        """
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """
+        Logs requests like the rest of Sweeper, which also works on Unix sockets
+        """
+        print("INFO: Request {}".format(format % args))
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering each request on its own thread
+    """
+    daemon_threads = True
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """
+    HTTP server on a Unix socket, answering each request on its own thread
+    """
+    daemon_threads = True
+
+class SweepUnit(object):
+    """
+    A single (profile, region, check) piece of work and the output it produced
+    """
+    def __init__(self, profile, region, check, method, collections):
+        self.profile = profile
+        self.region = region
+        self.check = check
+        self.method = method
+        self.collections = collections
+        self.lines = []
+        self.findings = []
+        self.profile_missing = False
+        self.failed = False
+        self.skipped = False
+        # Whether the time budget stopped the unit part way through
+        self.cut_off = False
+        self.seconds = 0.0
+
+    def output(self, string):
+        """
+        Buffers a line of output until the unit is reported
+        """
+        self.lines.append(string)
+
+    def record(self, resource_id, reason):
+        """
+        Buffers a structured finding until the unit is reported
+        """
+        self.findings.append(Finding(self.profile, self.region, self.check, resource_id, reason, 'current'))
+
+    def finding(self, resource_id, reason, line=None):
+        """
+        Records a finding and reports it as a line, by default the resource id followed by the reason
+        """
+        self.record(resource_id, reason)
+        self.output(line or "{} {}".format(resource_id, reason))
+
 class Sweeper(object):
     """
     Sweeper class object
     """
-    def __init__(self, args):
+    def __init__(self, args, run=True):
         # Sensible class defaults
         self.profile_list = []
-        self.current_profile = ''
         self.regions_to_exclude = []
         self.checks_to_exclude = []
         self.regions = [
@@ -72,14 +1518,54 @@ class Sweeper(object):
         ]
         self.config_location = './config.yml'
         self.output_file = False
-        self.message = ''
+        self.sinks = []
+        self.workers = 1
+        self.stack_workers = 1
+        self.stack_executor = None
+        self.rate = 20.0
+        self.inventory_config = {}
+        self.inventory = None
+        self.since_last = False
+        self.region_config = {}
+        self.region_finder = None
+        self.org_config = {}
+        self.time_budget = 0
+        self.spill = None
+        self.check_values = dict(CHECK_VALUES)
+        self.s3_idle_days = 90
+        self.bucket_lock = threading.Lock()
+        self.bucket_locks = {}
+        self.bucket_regions = {}
+        # Regions botocore has an endpoint for, per service, loaded on first use
+        self.endpoint_lock = threading.Lock()
+        self.endpoints = {}
+        self.sweep_lock = threading.Lock()
+        self.sweeps = 0
+        self.last = None
+        # Whether every sweep reports its metrics, as the daemon's sweeps do
+        self.daemon = False
+        self.profile_report = '--profile-report' in args
+        self.prometheus = args.get('--prometheus')
 
         # Function calls
         self.set_config_file(args)
         self.set_output(args)
+        self.set_workers(args)
         self.load_file()
+        self.set_inventory(args)
+        self.budget = TimeBudget()
+        self.limiter = RateLimiter(self.rate, budget=self.budget)
+        self.instruments = Instruments()
+        # Hooks run in this order on each attempt, so the limiter's wait is neither timed
+        # nor let run past the deadline
+        self.pool = ClientPool(max(self.workers, self.stack_workers), [self.limiter, self.instruments, self.budget])
+        self.cache = ResourceCache(self.create_client, self.inventory, self.spill)
+        self.set_region_finder(args)
         self.set_profile(args)
-        self.run_sweeper(args)
+        if run and '--daemon' in args:
+            self.run_daemon(args)
+        elif run:
+            self.run_sweeper(args)
 
     def set_config_file(self, args):
         """
@@ -92,16 +1578,134 @@ class Sweeper(object):
 
     def set_output(self, args):
         """
-        Sets whether to output to a file or not
+        Sets whether to output to a file or not, and which finding files to write
         """
         self.output_file = '-o' in args
+        self.sinks = [TextSink(args.get('-o'))]
+        if '--jsonl' in args:
+            self.sinks.append(JsonLinesSink(args['--jsonl']))
+        if '--csv' in args:
+            self.sinks.append(CsvSink(args['--csv']))
+
+    def set_workers(self, args):
+        """
+        Sets how many units, and how many Opsworks stack queries, are swept concurrently,
+        and the other limits of a sweep: its rate, time budget and spill directory
+        """
+        workers = args.get('--workers', args.get('-j', 1))
+        stack_workers = args.get('--stack-workers', 1)
+        try:
+            self.workers = max(1, int(workers))
+            self.stack_workers = max(1, int(stack_workers))
+        except ValueError:
+            print("ERROR: Workers must be a number, got {} and {}".format(workers, stack_workers))
+            sys.exit(1)
+        try:
+            self.rate = float(args.get('--rate', self.rate))
+        except ValueError:
+            print("ERROR: Rate must be a number, got {}".format(args['--rate']))
+            sys.exit(1)
+        if self.rate <= 0:
+            print("ERROR: Rate must be more than 0 calls per second, got {}".format(args['--rate']))
+            sys.exit(1)
+        try:
+            self.time_budget = float(args.get('--time-budget', 0))
+        except ValueError:
+            print("ERROR: Time budget must be a number of seconds, got {}".format(args['--time-budget']))
+            sys.exit(1)
+        if '--time-budget' in args and self.time_budget <= 0:
+            print("ERROR: Time budget must be more than 0 seconds, got {}".format(args['--time-budget']))
+            sys.exit(1)
+        if '--spill' in args:
+            self.spill = args['--spill']
+            if not os.path.isdir(self.spill):
+                print("ERROR: Spill directory {} does not exist".format(self.spill))
+                sys.exit(1)
+        if self.stack_workers > 1:
+            # Shared by every Opsworks unit so the cap holds across regions and profiles
+            self.stack_executor = ThreadPoolExecutor(max_workers=self.stack_workers)
+
+    def set_inventory(self, args):
+        """
+        Opens the inventory if one is configured or needed for --since-last or
+        the timings --time-budget learns from
+        """
+        self.since_last = '--since-last' in args
+        path = args.get('--inventory', self.inventory_config.get('path'))
+        if not path and (self.since_last or self.time_budget):
+            path = './sweeper.db'
+        if not path:
+            return
+        self.inventory = Inventory(
+            path,
+            self.inventory_config.get('ttl', 0),
+            self.inventory_config.get('ttls')
+        )
+        print("INFO: Using inventory {}".format(path))
+
+    def set_region_finder(self, args):
+        """
+        Discovers each profile's regions instead of using the built in list,
+        if configured or asked for with --discover-regions
+        """
+        if not self.region_config and '--discover-regions' not in args:
+            return
+        config = self.region_config if isinstance(self.region_config, dict) else {}
+        path = config.get('path', './regions.json')
+        self.region_finder = RegionFinder(self.pool, path, config.get('ttl', 86400))
+        print("INFO: Discovering regions, cached in {}".format(path))
+
+    def regions_for(self, profile):
+        """
+        Returns the regions to sweep for a profile, leaving out regions_to_exclude
+        """
+        if not self.region_finder:
+            return self.regions
+        regions = self.region_finder.regions(profile)
+        if regions is None:
+            print("WARN: Unable to discover regions for profile ({}), using the built in list".format(profile))
+            return self.regions
+        dropped = self.region_finder.dropped.pop(profile, None)
+        if dropped:
+            print("WARN: Skipping unreachable or disabled regions for profile ({}): {}".format(
+                profile,
+                ', '.join(dropped))
+            )
+        return [region for region in regions if region not in self.regions_to_exclude]
+
+    def set_organization(self, args):
+        """
+        Sweeps every active account of the AWS Organization instead of profiles,
+        assuming the role named by --org-role or the organization config in each
+        """
+        role = args.get('--org-role', self.org_config.get('role'))
+        if not role:
+            print("ERROR: No role to assume in the Organization's accounts. Set --org-role or organization: role")
+            sys.exit(1)
+        try:
+            self.pool.roles = RoleCredentials(
+                self.pool.session(self.org_config.get('profile')),
+                role,
+                self.org_config.get('session_name', 'Sweeper'),
+                int(self.org_config.get('duration', 3600))
+            )
+            accounts = self.pool.roles.list_accounts([str(account) for account in self.org_config.get('exclude') or []])
+        except (ClientError, BotoCoreError) as err:
+            print("ERROR: Unable to list the accounts of the Organization: {}".format(err))
+            sys.exit(1)
+        if self.profile_list or '-p' in args:
+            print("WARN: Overriding profiles with the accounts of the Organization")
+        self.profile_list = accounts
+        print("INFO: Sweeping {} Organization accounts, assuming role {}".format(len(accounts), role))
 
     def set_profile(self, args):
         """
         Sets the correct profile to use.
         :param args: List of arguments
         """
-        if '-p' in args:
+        if self.org_config or '--org-role' in args:
+            self.set_organization(args)
+        elif '-p' in args:
             # Profile provided. Is there a valid aws creds file installed?
             # Overwrites profiles found in config.yml
             if self.profile_list:
@@ -141,8 +1745,9 @@ class Sweeper(object):
         # First, lets read the YAML file and parse what we need
         try:
             with open(self.config_location) as stream:
-                params = yaml.load(stream)
+                params = yaml.safe_load(stream)
                 if 'regions_to_exclude' in params and params['regions_to_exclude']:
+                    self.regions_to_exclude = params['regions_to_exclude']
                     for region in params['regions_to_exclude']:
                         if region in self.regions:
                             self.regions.remove(region)
@@ -153,6 +1758,21 @@ class Sweeper(object):
                 if 'profiles' in params and params['profiles']:
                     self.profile_list = params['profiles']
 
+                if 'inventory' in params and params['inventory']:
+                    self.inventory_config = params['inventory']
+
+                if 's3_idle_days' in params and params['s3_idle_days']:
+                    self.s3_idle_days = int(params['s3_idle_days'])
+
+                if 'check_values' in params and params['check_values']:
+                    self.check_values.update(params['check_values'])
+
+                if 'organization' in params and params['organization']:
+                    self.org_config = params['organization']
+
+                if 'discover_regions' in params and params['discover_regions']:
+                    self.region_config = params['discover_regions']
+
         except yaml.YAMLError as err:
             print(str(err))
             sys.exit(1)
@@ -165,267 +1785,627 @@ class Sweeper(object):
                 print("ERROR: Default config.yml cannot be found. Exiting")
                 sys.exit(1)
 
-    def create_client(self, service, region):
+    def create_client(self, service, region, profile=None):
         """
-        Sets up the current session object needed to perform the API calls
+        Returns the pooled client needed to perform the API calls for a profile
         """
-        if self.current_profile:
-            session = boto3.Session(
-                profile_name=self.current_profile,
-                region_name=region
-            )
-            return session.client(service)
-        else:
-            return boto3.client(service, region_name=region)
+        return self.pool.client(service, region, profile)
+
+    def resources(self, unit, name):
+        """
+        Returns a resource collection declared by the unit's check from the sweep cache
+        """
+        return self.cache.get(unit.profile, unit.region, name)
 
     def output(self, string):
         """
         Determines how to output the results
         """
-        if self.output_file:
-            self.message += string
-            self.message += '\n'
-        else:
-            print(string)
+        for sink in self.sinks:
+            sink.line(string)
+
+    def report(self, finding):
+        """
+        Passes a finding on to every sink
+        """
+        for sink in self.sinks:
+            sink.finding(finding)
+
+    def flush(self):
+        """
+        Writes out what every sink has buffered
+        """
+        for sink in self.sinks:
+            sink.flush()
 
-    def check_elbs(self):
+    def check_elbs(self, unit):
         """
         Uses the API's to check for orphaned ELB's
         """
-        try:
-            for region in self.regions:
-                client = self.create_client('elb', region)
-                self.output("\nChecking for orphaned ELB's in {}".format(region))
-                self.output("This sweep looks for ELB's without any attached instances.")
-                self.output("==========================================================")
-                response = client.describe_load_balancers()
-                for elb in response['LoadBalancerDescriptions']:
-                    if not elb['Instances']:
-                        self.output("{} does not have any instances attached".format(elb['LoadBalancerName']))
-                self.output("ELB sweep in {} complete".format(region))
-                self.output("All configured regions checked for orphaned ELB's")
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        elbs = self.resources(unit, 'elb-idle-load-balancers')
+        unit.output("\nChecking for orphaned ELB's in {}".format(unit.region))
+        unit.output("This sweep looks for ELB's without any attached instances.")
+        unit.output("==========================================================")
+        for name in elbs.values('LoadBalancerName'):
+            unit.finding(name, "does not have any instances attached")
+        unit.output("ELB sweep in {} complete".format(unit.region))
+        unit.output("All configured regions checked for orphaned ELB's")
 
-    def check_ebs_volumes(self):
+    def check_ebs_volumes(self, unit):
         """
         Uses the API's to check for unattached volumes.
-        #TODO currently max 500 results
         """
-        try:
-            for region in self.regions:
-                self.output("\nChecking for unattached EBS Volumes in {}".format(region))
-                self.output("==========================================================")
-                client = self.create_client('ec2', region)
-                response = client.describe_volumes()
-                for volume in response['Volumes']:
-                    if not volume['Attachments']:
-                        self.output("{} does not have any attachments".format(volume['VolumeId']))
-                self.output("Volume sweep in {} complete".format(region))
-                self.output("All configured regions checked for unattached EBS volumes")
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        unit.output("\nChecking for unattached EBS Volumes in {}".format(unit.region))
+        unit.output("==========================================================")
+        for volume_id in self.resources(unit, 'ec2-available-volumes').values('VolumeId'):
+            unit.finding(volume_id, "does not have any attachments")
+        unit.output("Volume sweep in {} complete".format(unit.region))
+        unit.output("All configured regions checked for unattached EBS volumes")
 
-    def check_snapshots(self):
+    def check_snapshots(self, unit):
         """
-        Checks if EBS snapshots are paired to AMI's
+        Checks if EBS snapshots owned by the account are paired to AMI's
         """
-        try:
-            for region in self.regions:
-                snapshot_list = []
-                self.output("\nChecking for unused snapshots in {}".format(region))
-                self.output("**WARNING: This can take along time. Please use with caution**")
-                self.output("==========================================================")
-                client = self.create_client('ec2', region)
-                snapshots = client.describe_snapshots(
-                    Filters=[
-                        {
-                            'Name':'status',
-                            'Values': [
-                                'completed'
-                            ]
-                        }
-                    ]
-                )
-                images = client.describe_images(
-                    Filters=[
-                        {
-                            'Name':'state',
-                            'Values': [
-                                'available'
-                            ]
-                        }
-                    ]
-                )
-                for snapshot in snapshots['Snapshots']:
-                    snapshot_id = snapshot['SnapshotId']
-                    snapshot_found = False
-                    for image in images['Images']:
-                        if 'BlockDeviceMappings' in image:
-                            for mapping in image['BlockDeviceMappings']:
-                                if 'Ebs' in mapping:
-                                    if 'SnapshotId' in mapping['Ebs']:
-                                        if mapping['Ebs']['SnapshotId'] == snapshot_id:
-                                            snapshot_found = True
-                                            break
-                    if not snapshot_found:
-                        snapshot_list.append(snapshot_id)
-                self.output("There are {} snapshots to remove".format(len(snapshot_list)))
-                if self.output_file:
-                    for snap in snapshot_list:
-                        self.output(snap)
-                self.output("Snapshot sweep complete in {}".format(region))
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        unit.output("\nChecking for unused snapshots in {}".format(unit.region))
+        unit.output("==========================================================")
+        # Join the snapshots against every snapshot one of our AMI's uses, so
+        # each snapshot is a single set lookup rather than a scan of every image
+        image_snapshots = self.resources(unit, 'ec2-images').keys('BlockDeviceMappings[].Ebs.SnapshotId')
+        snapshot_list = []
+        reason = "is not used by any AMI"
+        for snapshot_id in self.resources(unit, 'ec2-snapshots').anti_join('SnapshotId', image_snapshots, 'SnapshotId'):
+            snapshot_list.append(snapshot_id)
+            unit.record(snapshot_id, reason)
+        unit.output("There are {} snapshots to remove".format(len(snapshot_list)))
+        if self.output_file:
+            for snap in snapshot_list:
+                unit.output(snap)
+        unit.output("Snapshot sweep complete in {}".format(unit.region))
 
-    def check_eips(self):
+    def check_eips(self, unit):
         """
         Checks if EIPS arent attached to an instance
         """
-        try:
-            for region in self.regions:
-                self.output("\nChecking for unattached EIP's in {}".format(region))
-                self.output("==========================================================")
-                client = self.create_client('ec2', region)
-                response = client.describe_addresses()
-                for address in response['Addresses']:
-                    if 'InstanceId' not in address:
-                        self.output("{} is not attached to any instance.".format(address['PublicIp']))
-                self.output("EIP sweep complete in {}".format(region))
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        unit.output("\nChecking for unattached EIP's in {}".format(unit.region))
+        unit.output("==========================================================")
+        for address in self.resources(unit, 'ec2-unassociated-addresses').values('PublicIp'):
+            unit.finding(address, "is not attached to any instance.")
+        unit.output("EIP sweep complete in {}".format(unit.region))
 
-    def check_beanstalk_environments(self):
+    def check_beanstalk_environments(self, unit):
         """
         Checks for ElasticBeanstalk environments and if they are still running. These
         environments can incur a cost as they are designed to be highly available
         """
-        try:
-            for region in self.regions:
-                self.output("\nChecking for Beanstalk environments still running in {}".format(region))
-                self.output("This checks for environments which will keep services running at a cost")
-                self.output("==========================================================")
-                client = self.create_client('elasticbeanstalk', region)
-                response = client.describe_environments(IncludeDeleted=False)
-                for environment in response['Environments']:
-                    self.output("{} is still running. Did you know this?".format(environment['EnvironmentName']))
-                self.output("ElasticBeanstalk sweep complete in {}".format(region))
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        unit.output("\nChecking for Beanstalk environments still running in {}".format(unit.region))
+        unit.output("This checks for environments which will keep services running at a cost")
+        unit.output("==========================================================")
+        for environment in self.resources(unit, 'elasticbeanstalk-environments').values('EnvironmentName'):
+            unit.finding(environment, "is still running. Did you know this?")
+        unit.output("ElasticBeanstalk sweep complete in {}".format(unit.region))
 
-    def check_opsworks(self):
+    def check_opsworks(self, unit):
         """
         Checks all running services managed by Opsworks.
         """
-        try:
-            for region in self.regions:
-                self.output("\nChecking for Opsworks provisioned resources in {}".format(region))
-                self.output("Opsworks has self-healing functionality that potentially could have")
-                self.output("healed a service that you destroyed elsewhere.")
-                self.output("==========================================================")
-                client = self.create_client('opsworks', region)
-                response = client.describe_stacks()
-                for stack in response['Stacks']:
-                    # first list any ecs clusters
-                    stack_id = stack['StackId']
-                    self.output("Checking Stack ID {} for services. Information gathering for action.".format(stack_id))
-                    # ECS
-                    ecs = client.describe_ecs_clusters(StackId=stack_id)
-                    self.output("{} has {} running ECS Clusters".format(stack_id, len(ecs['EcsClusters'])))
-                    # EIP
-                    eip = client.describe_elastic_ips(StackId=stack_id)
-                    self.output("{} has {} EIP's".format(stack_id, len(eip['ElasticIps'])))
-                    # EC2 Instances
-                    instances = client.describe_instances(StackId=stack_id)
-                    self.output("{} has {} Ec2 instances running".format(
-                        stack_id,
-                        len(instances['Instances']))
-                    )
-                    # ELB
-                    elbs = client.describe_elastic_load_balancers(StackId=stack_id)
-                    self.output("{} has {} ELB's running".format(stack_id, len(elbs['ElasticLoadBalancers'])))
-                    # RDS
-                    rds = client.describe_rds_db_instances(StackId=stack_id)
-                    self.output("{} has {} RDS instances running".format(
-                        stack_id,
-                        len(rds['RdsDbInstances']))
-                    )
-                    # EBS
-                    ebs = client.describe_volumes(StackId=stack_id)
-                    self.output("{} has {} EBS Volumes registered".format(stack_id, len(ebs['Volumes'])))
+        unit.output("\nChecking for Opsworks provisioned resources in {}".format(unit.region))
+        unit.output("Opsworks has self-healing functionality that potentially could have")
+        unit.output("healed a service that you destroyed elsewhere.")
+        unit.output("==========================================================")
+        client = self.create_client('opsworks', unit.region, unit.profile)
+        stack_ids = self.resources(unit, 'opsworks-stacks').values('StackId')
+        for stack_id, counts in self.count_stack_resources(client, stack_ids):
+            unit.output("Checking Stack ID {} for services. Information gathering for action.".format(stack_id))
+            for (_, _, line), total in zip(OPSWORKS_QUERIES, counts):
+                unit.output(line.format(stack_id, total))
+            unit.record(stack_id, "is managed by Opsworks with {} ECS Clusters, {} EIP's, {} Ec2 instances, "
+                                  "{} ELB's, {} RDS instances and {} EBS Volumes".format(*counts))
 
-                self.output("Opsworks sweep complete in {}".format(region))
-        except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+        unit.output("Opsworks sweep complete in {}".format(unit.region))
+
+    def count_stack_resources(self, client, stack_ids):
+        """
+        Yields each stack id with the counts of its OPSWORKS_QUERIES, in stack order.
+        With stack workers the queries of many stacks are run at once
+        """
+        def query(stack_id, operation, key):
+            return count(paginate(client, operation, key, StackId=stack_id))
+
+        if self.stack_executor is None:
+            for stack_id in stack_ids:
+                yield stack_id, [query(stack_id, operation, key) for operation, key, _ in OPSWORKS_QUERIES]
+            return
+
+        stacks = [
+            (stack_id, [self.stack_executor.submit(query, stack_id, operation, key)
+                        for operation, key, _ in OPSWORKS_QUERIES])
+            for stack_id in stack_ids
+        ]
+        try:
+            for stack_id, futures in stacks:
+                yield stack_id, [future.result() for future in futures]
+        finally:
+            for _, futures in stacks:
+                for future in futures:
+                    future.cancel()
 
-    def check_rds_snapshots(self):
+    def check_rds_snapshots(self, unit):
         """
         Checks for rds snapshots that are no longer linked to an active rds instance
         """
-        def get_data(function, key, marker=None):
-            if marker:
-                response = function(Marker=marker)
+        unit.output("\nChecking for Orphaned RDS Snapshots in {}".format(unit.region))
+        unit.output("==========================================================")
+        instances = self.resources(unit, 'rds-instances').keys('DBInstanceIdentifier')
+        snapshots = self.resources(unit, 'rds-kept-snapshots')
+        for snapshot_id in snapshots.anti_join('DBInstanceIdentifier', instances, 'DBSnapshotIdentifier'):
+            unit.finding(
+                snapshot_id,
+                "no longer tied to an RDS instance",
+                "Snapshot {} no longer tied to an RDS instance".format(snapshot_id)
+            )
+        unit.output("RDS Sweep complete in {}".format(unit.region))
+
+    def check_s3_buckets(self, unit):
+        """
+        Checks for S3 buckets that have not been used in s3_idle_days. CloudWatch
+        request and storage metrics are used where a bucket has them, and only
+        buckets without any are listed, stopping at the first recent object.
+        Without request metrics, only whether a bucket was written to is known
+        """
+        unit.output("\nChecking for idle S3 buckets in {}".format(unit.region))
+        unit.output("This sweep looks for buckets not used in the last {} days.".format(self.s3_idle_days))
+        unit.output("==========================================================")
+        cutoff = datetime.datetime.now(tzutc()) - datetime.timedelta(days=self.s3_idle_days)
+        # Buckets made since the cutoff can't have been idle for long enough
+        buckets = [name for name, created in self.buckets(unit) if created < cutoff]
+        if unit.region == 'us-east-1':
+            # Buckets are listed from us-east-1, so it reports those it couldn't place
+            unlocated = [name for name, _ in self.bucket_regions[unit.profile].get(None, [])]
+            if unlocated:
+                unit.output("Could not determine the region of {} buckets: {}".format(
+                    len(unlocated), ', '.join(unlocated)))
+        metrics = self.bucket_metrics(unit, buckets, cutoff)
+        client = self.create_client('s3', unit.region, unit.profile)
+        for bucket in buckets:
+            requests, objects = metrics.get(bucket, (None, []))
+            if requests is not None:
+                if requests == 0:
+                    unit.finding(bucket, "has had no requests in {} days".format(self.s3_idle_days))
+            elif objects and objects[-1][1] == 0:
+                unit.finding(bucket, "is empty")
+            elif objects and objects[0][0] <= cutoff + datetime.timedelta(days=2):
+                # Storage metrics are daily, so a series that reaches back to
+                # the cutoff shows whether anything was added or removed since
+                if len(set(value for _, value in objects)) == 1:
+                    unit.finding(bucket, "has had the same number of objects for {} days".format(
+                        self.s3_idle_days))
             else:
-                response = function()
-            if 'Marker' in response:
-                return response[key] + get_data(client, key, response['Marker'])
-            return response[key]
+                self.check_bucket_objects(unit, client, bucket, cutoff)
+        unit.output("S3 sweep complete in {}".format(unit.region))
+
+    def buckets(self, unit):
+        """
+        Returns the (name, creation date) of the profile's buckets in the unit's
+        region. Buckets are listed once per profile per sweep, and a listing that
+        failed fails the profile's other s3 units without being tried again
+        """
+        with self.bucket_lock:
+            lock = self.bucket_locks.setdefault(unit.profile, threading.Lock())
+        with lock:
+            if unit.profile not in self.bucket_regions:
+                try:
+                    self.bucket_regions[unit.profile] = self.locate_buckets(unit.profile)
+                except (ClientError, BotoCoreError) as err:
+                    self.bucket_regions[unit.profile] = err
+            located = self.bucket_regions[unit.profile]
+        if isinstance(located, Exception):
+            raise located
+        return located.get(unit.region, [])
+
+    def locate_buckets(self, profile):
+        """
+        Groups the profile's buckets by region. Listings that don't include each
+        bucket's region have it looked up for every bucket concurrently, and
+        buckets whose region can't be looked up are grouped under None
+        """
+        client = self.pool.client('s3', 'us-east-1', profile, S3_LOCATION_CONFIG)
+        buckets = list(paginate(client, 'list_buckets', 'Buckets'))
+
+        def locate(bucket):
+            if bucket.get('BucketRegion'):
+                return bucket['BucketRegion']
+            try:
+                location = client.get_bucket_location(Bucket=bucket['Name']).get('LocationConstraint')
+            except ClientError:
+                return None
+            return {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(location, location)
+
+        executor = ThreadPoolExecutor(max_workers=S3_LOCATION_WORKERS)
+        try:
+            regions = list(executor.map(locate, buckets))
+        finally:
+            executor.shutdown(wait=True)
+        located = {}
+        for bucket, region in zip(buckets, regions):
+            located.setdefault(region, []).append((bucket['Name'], bucket['CreationDate']))
+        return located
+
+    def bucket_metrics(self, unit, buckets, cutoff):
+        """
+        Returns each bucket's total requests since the cutoff, or None without request
+        metrics, and its daily object counts, oldest first, from batched CloudWatch calls
+        """
+        client = self.create_client('cloudwatch', unit.region, unit.profile)
+        values = {}
+        # Two queries a bucket, and at most 500 queries a call
+        for start in range(0, len(buckets), 250):
+            queries = []
+            for i, bucket in enumerate(buckets[start:start + 250], start):
+                queries.append({'Id': 'r{}'.format(i), 'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/S3', 'MetricName': 'AllRequests', 'Dimensions': [
+                        {'Name': 'BucketName', 'Value': bucket},
+                        {'Name': 'FilterId', 'Value': 'EntireBucket'}
+                    ]},
+                    'Period': self.s3_idle_days * 86400,
+                    'Stat': 'Sum'
+                }})
+                queries.append({'Id': 'o{}'.format(i), 'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/S3', 'MetricName': 'NumberOfObjects', 'Dimensions': [
+                        {'Name': 'BucketName', 'Value': bucket},
+                        {'Name': 'StorageType', 'Value': 'AllStorageTypes'}
+                    ]},
+                    'Period': 86400,
+                    'Stat': 'Average'
+                }})
+            try:
+                for result in paginate(client, 'get_metric_data', 'MetricDataResults',
+                                       MetricDataQueries=queries,
+                                       StartTime=cutoff,
+                                       EndTime=datetime.datetime.now(tzutc()),
+                                       ScanBy='TimestampAscending'):
+                    values.setdefault(result['Id'], []).extend(zip(result['Timestamps'], result['Values']))
+            except ClientError as err:
+                unit.output("Unable to read CloudWatch metrics, listing bucket objects instead: {}".format(err))
+                return {}
+        return dict(
+            (bucket, (
+                sum(value for _, value in values['r{}'.format(i)]) if values.get('r{}'.format(i)) else None,
+                sorted(values.get('o{}'.format(i), []))
+            )) for i, bucket in enumerate(buckets)
+        )
 
+    def check_bucket_objects(self, unit, client, bucket, cutoff):
+        """
+        Streams a bucket's objects until one was written since the cutoff. Only
+        a bucket whose objects are all older than that, or that has none, is reported
+        """
+        listed = 0
+        try:
+            for item in islice(paginate(client, 'list_objects_v2', 'Contents', Bucket=bucket), S3_LIST_LIMIT):
+                if item['LastModified'] >= cutoff:
+                    return
+                listed += 1
+        except ClientError as err:
+            unit.output("Unable to list the objects in bucket {}: {}".format(bucket, err))
+            return
+        if listed >= S3_LIST_LIMIT:
+            unit.output("Bucket {} has no CloudWatch metrics and too many objects to list".format(bucket))
+        elif listed == 0:
+            unit.finding(bucket, "is empty")
+        else:
+            unit.finding(bucket, "has not been written to in {} days".format(self.s3_idle_days))
+
+    def build_units(self, profile, checks=None):
+        """
+        Builds the (profile, region, check) units for a profile, in report order,
+        optionally only for the given checks
+        """
+        units = []
+        regions = self.regions_for(profile)
+        for check, method, collections in CHECKS:
+            if check in self.checks_to_exclude or (checks and check not in checks):
+                continue
+            services = set(COLLECTIONS[name][0] for name in collections)
+            for region in regions:
+                if not all(self.has_endpoint(service, region) for service in services):
+                    continue
+                self.cache.plan(profile, region, collections)
+                units.append(SweepUnit(profile, region, check, getattr(self, method), collections))
+        return units
+
+    def has_endpoint(self, service, region):
+        """
+        Whether a service can be used in a region, as far as botocore knows. Regions
+        newer than the installed botocore, and services it knows no regions for,
+        are not ruled out, so their checks run and report what went wrong
+        """
+        with self.endpoint_lock:
+            if not self.endpoints:
+                session = botocore.session.get_session()
+                for name in set(spec[0] for spec in COLLECTIONS.values()) | set(['ec2']):
+                    self.endpoints[name] = set(
+                        known
+                        for partition in session.get_available_partitions()
+                        for known in session.get_available_regions(name, partition)
+                    )
+        regions = self.endpoints.get(service)
+        return not regions or region not in self.endpoints['ec2'] or region in regions
+
+    def run_unit(self, unit):
+        """
+        Runs a single unit, capturing its output rather than writing it
+        """
+        started = time.time()
         try:
-            for region in self.regions:
-                self.output("\nChecking for Orphaned RDS Snapshots in {}".format(region))
-                self.output("==========================================================")
-                client = self.create_client('rds', region)
-                snapshots = get_data(client.describe_db_snapshots, 'DBSnapshots')
-                instances = get_data(client.describe_db_instances, 'DBInstances')
-                for snapshot in snapshots:
-                    found = False
-                    for instance in instances:
-                        if instance['DBInstanceIdentifier'] == snapshot['DBInstanceIdentifier']:
-                            found = True
-                            break
-
-                    if not found:
-                        self.output("Snapshot {} no longer tied to an RDS instance".format(snapshot['DBSnapshotIdentifier']))
-                self.output("RDS Sweep complete in {}".format(region))
+            if self.budget.expired():
+                unit.skipped = True
+            else:
+                unit.method(unit)
+        except OutOfTime:
+            unit.skipped = True
+            unit.cut_off = True
         except ClientError as err:
-            self.output(err)
-            self.output("Your AWS profile does not have access. Please fix this and try again\n")
+            unit.failed = True
+            unit.output(err)
+            if err.response.get('Error', {}).get('Code') in THROTTLE_CODES:
+                unit.output("AWS kept throttling this sweep after retrying. Try again with a lower --rate\n")
+            else:
+                unit.output("Your AWS profile does not have access. Please fix this and try again\n")
+        except UnknownServiceError as err:
+            unit.failed = True
+            unit.output(err)
+            unit.output("This check's service is not supported by the installed botocore\n")
+        except ProfileNotFound:
+            unit.profile_missing = True
+        except BotoCoreError as err:
+            unit.failed = True
+            unit.output(err)
+            unit.output("AWS could not be reached for this check. Please check your network and credentials\n")
+        finally:
+            unit.seconds = time.time() - started
+            self.cache.release(unit.profile, unit.region, unit.collections)
+            self.instruments.record_unit(unit, unit.seconds)
+        return unit
+
+    def execute(self, units, order=None):
+        """
+        Yields each unit once it has run, always in the order they were given.
+        With more than one worker the units are run concurrently on a bounded pool,
+        and they are started in the given order if there is one
+        """
+        if self.workers <= 1 and order is None:
+            for unit in units:
+                yield self.run_unit(unit)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = dict((id(unit), executor.submit(self.run_unit, unit)) for unit in order or units)
+        try:
+            for unit in units:
+                yield futures[id(unit)].result()
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def prioritise(self, units):
+        """
+        Orders units by the value of their findings per second in previous sweeps.
+        Units that have never been timed are expected to take UNTIMED_SECONDS and
+        find UNTIMED_FINDINGS, so they go after the timed units that are worth more
+        """
+        timings = self.inventory.timings()
+
+        def value(unit):
+            seconds, findings = timings.get((unit.profile or '', unit.region, unit.check), (UNTIMED_SECONDS, UNTIMED_FINDINGS))
+            return (findings * self.check_values.get(unit.check, 1.0) + 1.0) / max(seconds, 0.01)
+        return sorted(units, key=value, reverse=True)
+
+    def report_changes(self, unit):
+        """
+        Reports only the findings of a unit that are new or resolved since the last sweep
+        """
+        previous = self.inventory.findings(unit.profile, unit.region, unit.check)
+        current = set(str(finding.resource_id) for finding in unit.findings)
+        new = [finding for finding in unit.findings if str(finding.resource_id) not in previous]
+        resolved = [
+            Finding(unit.profile, unit.region, unit.check, resource_id, previous[resource_id], 'resolved')
+            for resource_id in sorted(previous) if resource_id not in current
+        ]
+        self.output("\n{} in {}: {} new and {} resolved since the last sweep".format(
+            unit.check,
+            unit.region,
+            len(new),
+            len(resolved))
+        )
+        for finding in new:
+            self.output("NEW: {} {}".format(finding.resource_id, finding.reason))
+            self.report(finding._replace(status='new'))
+        for finding in resolved:
+            self.output("RESOLVED: {} {}".format(finding.resource_id, finding.reason))
+            self.report(finding)
+
+    def plan(self, profiles, checks=None):
+        """
+        Builds each profile's units, as (profile, units) in report order. Discovering
+        a profile's regions takes a few calls, so with more than one worker the
+        profiles are discovered concurrently
+        """
+        if self.workers <= 1 or not self.region_finder:
+            return [(profile, self.build_units(profile, checks)) for profile in profiles]
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            return list(zip(profiles, executor.map(partial(self.build_units, checks=checks), profiles)))
+        finally:
+            executor.shutdown(wait=True)
 
-    def run_checks(self):
+    def run_checks(self, profiles=None, checks=None):
         """
-        Wrapper function that runs the checks we need
+        Wrapper function that runs the checks we need, returning the units run
         """
-        for profile in self.profile_list:
+        plan = self.plan(profiles or self.profile_list, checks)
+        swept = [unit for _, units in plan for unit in units]
+        results = self.execute(swept, self.prioritise(swept) if self.time_budget else None)
+        for profile, units in plan:
             self.output("==========================================================")
             self.output('\nSweeping AWS profile ({})'.format(profile))
             self.output("==========================================================")
-            self.current_profile = profile
+            missing = False
+            for _ in units:
+                # What is reported so far reaches the files before waiting on the next unit
+                self.flush()
+                unit = next(results)
+                if missing:
+                    continue
+                if unit.skipped:
+                    self.output("\nSKIPPED: {} in {}, the time budget ran out".format(unit.check, unit.region))
+                    self.report(Finding(profile, unit.region, unit.check, '', 'the time budget ran out', 'skipped'))
+                    if self.inventory and unit.cut_off:
+                        self.inventory.save_timing(unit.profile, unit.region, unit.check, unit.seconds, len(unit.findings), cut_off=True)
+                    continue
+                if self.since_last and not unit.failed and not unit.profile_missing:
+                    self.report_changes(unit)
+                else:
+                    for line in unit.lines:
+                        self.output(line)
+                    for finding in unit.findings:
+                        self.report(finding)
+                if self.inventory and not unit.failed and not unit.profile_missing:
+                    self.inventory.save_findings(unit.profile, unit.region, unit.check, unit.findings)
+                    self.inventory.save_timing(unit.profile, unit.region, unit.check, unit.seconds, len(unit.findings))
+                if unit.profile_missing:
+                    self.output("AWS profile ({}) could not be found".format(profile))
+                    missing = True
+        self.flush()
+        skipped = len([unit for unit in swept if unit.skipped])
+        if skipped:
+            self.output("\n{} of {} checks were skipped when the time budget of {:g}s ran out".format(
+                skipped,
+                len(swept),
+                self.time_budget)
+            )
+        return swept
+
+    def sweep(self, profiles=None, checks=None, collect=False):
+        """
+        Runs one sweep, one at a time, and returns the status of every unit as a
+        dict, with its findings if collect is set. Findings also go to the configured
+        sinks as usual, and are only held in memory for callers that return them
+        """
+        with self.sweep_lock:
+            started = time.time()
+            self.bucket_regions = {}
+            if self.region_finder:
+                self.region_finder.reset()
+            if self.time_budget:
+                self.budget.deadline = started + self.time_budget
+            memory = MemorySink()
+            if collect:
+                self.sinks.append(memory)
             try:
-                if 'elb' not in self.checks_to_exclude:
-                    self.check_elbs()
-                if 'ebs-volumes' not in self.checks_to_exclude:
-                    self.check_ebs_volumes()
-                if 'ebs-snapshots' not in self.checks_to_exclude:
-                    self.check_snapshots()
-                if 'ec2-eips' not in self.checks_to_exclude:
-                    self.check_eips()
-                if 'elastic-beanstalk' not in self.checks_to_exclude:
-                    self.check_beanstalk_environments()
-                if 'opsworks' not in self.checks_to_exclude:
-                    self.check_opsworks()
-                if 'rds-snapshots' not in self.checks_to_exclude:
-                    self.check_rds_snapshots()
-                # TODO add s3 checks. Buckets that havent been access in n days. Are they still used?
-                # TODO more checks!
-            except ProfileNotFound:
-                self.output("AWS profile ({}) could not be found".format(self.current_profile))
+                self.output('Current Time {:%Y-%b-%d %H:%M:%S}'.format(datetime.datetime.now()))
+                units = self.run_checks(profiles, checks)
+                self.output("********************")
+                self.output("Sweeper is complete!")
+            except Exception:
+                self.cache.clear()
+                raise
+            finally:
+                self.budget.deadline = None
+                if collect:
+                    self.sinks.remove(memory)
+            self.sweeps += 1
+            if self.daemon:
+                self.report_metrics(started)
+            self.last = {
+                'started': started,
+                'duration': time.time() - started,
+                'findings': memory.findings,
+                'units': [{
+                    'profile': unit.profile,
+                    'region': unit.region,
+                    'check': unit.check,
+                    'status': 'profile_missing' if unit.profile_missing else 'failed' if unit.failed else
+                              'skipped' if unit.skipped else 'ok'
+                } for unit in units]
+            }
+            return self.last
+
+    def close(self):
+        """
+        Closes the sinks, the inventory and the Opsworks stack pool
+        """
+        for sink in self.sinks:
+            sink.close()
+        if self.inventory:
+            self.inventory.close()
+        if self.stack_executor:
+            self.stack_executor.shutdown(wait=True)
+
+    def listen(self, address):
+        """
+        Starts serving sweep requests on a host:port, or on a Unix socket if
+        given a path, in the background
+        """
+        if '/' in address:
+            if os.path.exists(address):
+                os.remove(address)
+            server = ThreadingUnixHTTPServer(address, SweepHandler)
+        else:
+            host, _, port = address.rpartition(':')
+            server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), SweepHandler)
+        server.sweeper = self
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print("INFO: Listening for sweep requests on {}".format(address))
+        return server
+
+    def run_daemon(self, args):
+        """
+        Keeps running with the same config, sessions and clients, sweeping every
+        --interval seconds and whenever asked to on the --listen endpoint
+        """
+        try:
+            interval = float(args.get('--interval', 0))
+        except ValueError:
+            print("ERROR: Interval must be a number of seconds, got {}".format(args['--interval']))
+            sys.exit(1)
+        if interval <= 0 and '--listen' not in args:
+            print("ERROR: Daemon mode needs an --interval, a --listen endpoint or both")
+            sys.exit(1)
+        try:
+            server = self.listen(args['--listen']) if '--listen' in args else None
+        except (ValueError, IOError, OSError) as err:
+            print("ERROR: Unable to listen on {}: {}".format(args['--listen'], err))
+            sys.exit(1)
+        self.daemon = True
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            while not stop.is_set():
+                started = time.time()
+                if interval > 0:
+                    try:
+                        result = self.sweep(collect=True)
+                        print("INFO: Sweep finished in {:.1f}s with {} findings".format(
+                            result['duration'],
+                            len(result['findings']))
+                        )
+                    except Exception as err:
+                        print("ERROR: Sweep failed: {}".format(err))
+                stop.wait(max(0, started + (interval if interval > 0 else 60) - time.time()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("INFO: Stopping the daemon")
+            if server:
+                server.shutdown()
+                server.server_close()
+                if '/' in args['--listen']:
+                    os.remove(args['--listen'])
+            self.close()
+        sys.exit(0)
 
     def run_sweeper(self, args):
         """
@@ -435,24 +2415,67 @@ class Sweeper(object):
             print("INFO: Sweeping to screen")
         else:
             print("INFO: Sweeping to {}".format(args['-o']))
+        for option in ('--jsonl', '--csv'):
+            if option in args:
+                print("INFO: Writing findings to {}".format(args[option]))
 
-        self.output('Current Time {:%Y-%b-%d %H:%M:%S}'.format(datetime.datetime.now()))
-        self.run_checks()
-
-        if self.output_file:
-            results = open(args['-o'], 'w')
-            results.write(self.message)
-            results.close()
-        self.output("********************")
-        self.output("Sweeper is complete!")
+        started = time.time()
+        try:
+            self.sweep()
+        finally:
+            self.close()
+        print("INFO: Created {} sessions and {} clients".format(
+            len(self.pool.sessions),
+            len(self.pool.clients))
+        )
+        print("INFO: Fetched {} resource collections, {} shared from the cache, {} served from the inventory".format(
+            self.cache.fetches,
+            self.cache.hits,
+            self.cache.stored)
+        )
+        print("INFO: Throttled {} times, waited {:.1f}s for the rate limiter".format(
+            self.limiter.throttles,
+            self.limiter.waited)
+        )
+        if self.pool.roles:
+            print("INFO: Assumed roles {} times for {} accounts".format(
+                self.pool.roles.assumed,
+                len(self.pool.roles.accounts))
+            )
+        self.report_metrics(started)
         sys.exit(0)
 
+    def report_metrics(self, started):
+        """
+        Prints the --profile-report and writes the --prometheus metrics of the
+        sweep started at started, if they were asked for. A daemon's metrics are
+        totals since it started, written after each of its sweeps
+        """
+        if self.profile_report:
+            print('\n'.join(self.instruments.report()))
+        if self.prometheus:
+            try:
+                self.instruments.write_prometheus(self.prometheus, {
+                    'last_run_timestamp_seconds': started,
+                    'run_duration_seconds': time.time() - started,
+                    'throttles': self.limiter.throttles,
+                    'rate_limiter_wait_seconds': self.limiter.waited,
+                    'clients': len(self.pool.clients),
+                    'collections_fetched': self.cache.fetches
+                })
+            except (IOError, OSError) as err:
+                print("WARN: Unable to write metrics to {}: {}".format(self.prometheus, err))
+                return
+            print("INFO: Metrics written to {}".format(self.prometheus))
+
 if __name__ == '__main__':
     # Get the args, pass them in or default them or fail
     OPTS = {}
     while sys.argv:
         if sys.argv[0] == '-h':
             show_usage()
+        elif sys.argv[0] in FLAGS:
+            OPTS[sys.argv[0]] = True
         elif sys.argv[0][0] == '-':
             try:
                 OPTS[sys.argv[0]] = sys.argv[1]
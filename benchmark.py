@@ -0,0 +1,441 @@
+"""
+Offline benchmarks for the Sweeper checks
+==================================================
+Runs each check against synthetic accounts served by a local stand-in for the
+AWS APIs, recording wall time, API calls and peak memory per check.
+No AWS account or credentials are needed
+==================================================
+"""
+
+#!/usr/bin/python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import tempfile
+import threading
+import tracemalloc
+import yaml
+import boto3
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+from dateutil.tz import tzutc
+from Sweeper import Sweeper, ClientPool, ResourceCache, CHECKS, COLLECTIONS, PUSHDOWN
+
+# Synthetic account sizes to benchmark, smallest first
+SCALES = [
+    ('1k', {
+        'snapshots': 1000, 'images': 500, 'volumes': 500, 'addresses': 50, 'elbs': 50,
+        'environments': 20, 'stacks': 20, 'rds_instances': 20, 'rds_snapshots': 100, 'buckets': 100
+    }),
+    ('10k', {
+        'snapshots': 10000, 'images': 10000, 'volumes': 5000, 'addresses': 200, 'elbs': 200,
+        'environments': 50, 'stacks': 100, 'rds_instances': 100, 'rds_snapshots': 500, 'buckets': 1000
+    }),
+    ('100k', {
+        'snapshots': 100000, 'images': 10000, 'volumes': 5000, 'addresses': 500, 'elbs': 500,
+        'environments': 100, 'stacks': 300, 'rds_instances': 300, 'rds_snapshots': 3000, 'buckets': 5000
+    }),
+]
+
+# How each stand-in operation pages its results:
+# (service, operation): (result key, input token, output token, default page size)
+PAGING = {
+    ('ec2', 'DescribeSnapshots'): ('Snapshots', 'NextToken', 'NextToken', 1000),
+    ('ec2', 'DescribeImages'): ('Images', 'NextToken', 'NextToken', 1000),
+    ('ec2', 'DescribeVolumes'): ('Volumes', 'NextToken', 'NextToken', 500),
+    ('ec2', 'DescribeAddresses'): ('Addresses', None, None, None),
+    ('elb', 'DescribeLoadBalancers'): ('LoadBalancerDescriptions', 'Marker', 'NextMarker', 400),
+    ('elasticbeanstalk', 'DescribeEnvironments'): ('Environments', 'NextToken', 'NextToken', 1000),
+    ('opsworks', 'DescribeStacks'): ('Stacks', None, None, None),
+    ('opsworks', 'DescribeEcsClusters'): ('EcsClusters', 'NextToken', 'NextToken', 100),
+    ('opsworks', 'DescribeElasticIps'): ('ElasticIps', None, None, None),
+    ('opsworks', 'DescribeInstances'): ('Instances', None, None, None),
+    ('opsworks', 'DescribeElasticLoadBalancers'): ('ElasticLoadBalancers', None, None, None),
+    ('opsworks', 'DescribeRdsDbInstances'): ('RdsDbInstances', None, None, None),
+    ('opsworks', 'DescribeVolumes'): ('Volumes', None, None, None),
+    ('rds', 'DescribeDBInstances'): ('DBInstances', 'Marker', 'Marker', 100),
+    ('rds', 'DescribeDBSnapshots'): ('DBSnapshots', 'Marker', 'Marker', 100),
+    ('s3', 'ListBuckets'): ('Buckets', 'ContinuationToken', 'ContinuationToken', None),
+    ('s3', 'ListObjectsV2'): ('Contents', 'ContinuationToken', 'NextContinuationToken', 1000),
+}
+
+# Services of checks that don't read any Sweeper collections
+CHECK_SERVICES = {
+    's3': ['s3', 'cloudwatch'],
+}
+
+# Measurements that are compared against a saved baseline
+MEASURES = ['calls', 'wall', 'peak']
+
+def show_usage():
+    """
+    Describes benchmark usage
+    """
+    print("usage: python benchmark.py [ -h ]")
+    print(" options:")
+    print("  -s <scale(s)>, Scales to run as a csv list (default all): {}".format(
+        ','.join(name for name, _ in SCALES))
+    )
+    print("  -k <check(s)>, Checks to run as a csv list (default all)")
+    print("  -j <n>, Number of workers to sweep with (default 1)")
+    print("  --save <file name>, Saves the results as JSON to use as a baseline")
+    print("  --compare <file name>, Compares against a saved baseline, failing on regressions")
+    print("  --tolerance <fraction>, How much worse than the baseline counts as a regression (default 0.25)")
+    sys.exit()
+
+class SyntheticObjects(object):
+    """
+    The objects of a synthetic bucket, only made a page at a time as they are listed
+    """
+    def __init__(self, name, count, recent, now):
+        self.name = name
+        self.count = count
+        self.recent = recent
+        self.now = now
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, window):
+        return [{
+            'Key': '{}/object-{:08d}'.format(self.name, i),
+            'Size': 1024,
+            'LastModified': self.now - datetime.timedelta(days=1 if i == self.recent else 400)
+        } for i in range(*window.indices(self.count))]
+
+class SyntheticAccount(object):
+    """
+    A generated account and the API stand-in serving it. Responses are returned
+    from botocore's before-call event, so clients are built and parameters are
+    validated as normal but nothing is sent over the network
+    """
+    def __init__(self, sizes, seed=42):
+        rng = random.Random(seed)
+        now = datetime.datetime(2017, 1, 1)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls = 0
+        self.data = {}
+        self.filtered = {}
+
+        snapshots = [{
+            'SnapshotId': 'snap-{:08x}'.format(i),
+            'VolumeId': 'vol-{:08x}'.format(rng.randrange(sizes['volumes'] or 1)),
+            'State': 'completed',
+            'VolumeSize': rng.choice([8, 20, 100]),
+            'StartTime': now,
+            'OwnerId': '123456789012'
+        } for i in range(sizes['snapshots'])]
+        self.data[('ec2', 'DescribeSnapshots')] = snapshots
+        # Roughly half the snapshots end up referenced by an AMI
+        self.data[('ec2', 'DescribeImages')] = [{
+            'ImageId': 'ami-{:08x}'.format(i),
+            'State': 'available',
+            'BlockDeviceMappings': [{
+                'DeviceName': '/dev/xvda',
+                'Ebs': {'SnapshotId': snapshots[(i * 2) % len(snapshots)]['SnapshotId']}
+            }, {
+                'DeviceName': '/dev/sdb',
+                'VirtualName': 'ephemeral0'
+            }] if snapshots else []
+        } for i in range(sizes['images'])]
+        self.data[('ec2', 'DescribeVolumes')] = [{
+            'VolumeId': 'vol-{:08x}'.format(i),
+            'Size': 8,
+            'State': 'in-use' if attached else 'available',
+            'Attachments': [{'InstanceId': 'i-{:08x}'.format(i), 'State': 'attached'}] if attached else []
+        } for i, attached in ((i, rng.random() < 0.8) for i in range(sizes['volumes']))]
+        self.data[('ec2', 'DescribeAddresses')] = [dict({
+            'PublicIp': '10.0.{}.{}'.format(i // 256, i % 256),
+            'AllocationId': 'eipalloc-{:08x}'.format(i)
+        }, **({'InstanceId': 'i-{:08x}'.format(i)} if rng.random() < 0.8 else {}))
+            for i in range(sizes['addresses'])]
+        self.data[('elb', 'DescribeLoadBalancers')] = [{
+            'LoadBalancerName': 'elb-{}'.format(i),
+            'Instances': [{'InstanceId': 'i-{:08x}'.format(i)}] if rng.random() < 0.8 else []
+        } for i in range(sizes['elbs'])]
+        self.data[('elasticbeanstalk', 'DescribeEnvironments')] = [{
+            'EnvironmentName': 'env-{}'.format(i),
+            'Status': 'Ready'
+        } for i in range(sizes['environments'])]
+
+        stacks = ['stack-{:04d}'.format(i) for i in range(sizes['stacks'])]
+        self.data[('opsworks', 'DescribeStacks')] = [{'StackId': stack, 'Name': stack} for stack in stacks]
+        for service, operation in sorted(PAGING):
+            if service == 'opsworks' and operation != 'DescribeStacks':
+                # Per-stack operations are looked up by StackId
+                self.data[(service, operation)] = dict(
+                    (stack, [{'StackId': stack}] * rng.randrange(4)) for stack in stacks
+                )
+
+        instances = ['db-{}'.format(i) for i in range(sizes['rds_instances'])]
+        self.data[('rds', 'DescribeDBInstances')] = [{'DBInstanceIdentifier': name} for name in instances]
+        # Automated snapshots always belong to a live instance, manual ones may not
+        self.data[('rds', 'DescribeDBSnapshots')] = [{
+            'DBSnapshotIdentifier': 'rds-snap-{}'.format(i),
+            'DBInstanceIdentifier': rng.choice(instances) if live else 'deleted-db-{}'.format(i),
+            'SnapshotType': 'automated' if live and rng.random() < 0.7 else 'manual'
+        } for i, live in ((i, bool(instances) and rng.random() < 0.7) for i in range(sizes['rds_snapshots']))]
+
+        # Buckets have request metrics, storage metrics only or none at all, in
+        # which case their objects are listed. Some are recent or in another region
+        today = datetime.datetime.now(tzutc())
+        self.buckets = {}
+        self.metrics = {}
+        self.objects = {}
+        for i in range(sizes['buckets']):
+            name = 'bucket-{:06d}'.format(i)
+            region = 'eu-west-1' if rng.random() < 0.2 else 'us-east-1'
+            self.buckets[name] = region
+            kind = rng.choice(['requests', 'storage', 'none'])
+            if kind == 'requests':
+                self.metrics[(name, 'AllRequests')] = [(today, rng.choice([0, 0, 120, 5000]))]
+            if kind in ('requests', 'storage'):
+                growth = rng.choice([0, 0, 1])
+                self.metrics[(name, 'NumberOfObjects')] = [
+                    (today - datetime.timedelta(days=day), 1000 - day * growth) for day in range(120, 0, -1)
+                ]
+            count = rng.choice([0, 10, 2500])
+            self.objects[name] = SyntheticObjects(name, count, rng.randrange(count) if rng.random() < 0.5 and count else -1, today)
+        self.data[('s3', 'ListBuckets')] = [dict({
+            'Name': name,
+            'CreationDate': today - datetime.timedelta(days=10 if i % 10 == 0 else 400)
+        }, **({'BucketRegion': self.buckets[name]} if i % 2 else {}))
+            for i, name in enumerate(sorted(self.buckets))]
+
+    def attach(self, session):
+        """
+        Serves every client built from the session from this account
+        """
+        session.events.register('before-parameter-build', self.capture)
+        session.events.register_first('before-call', self.respond)
+
+    def capture(self, params, **kwargs):
+        """
+        Keeps the caller's parameters, which before-call only sees serialised
+        """
+        self.local.params = params
+
+    def respond(self, model, **kwargs):
+        """
+        Returns one page of the requested collection as if it came from AWS
+        """
+        with self.lock:
+            self.calls += 1
+        params = self.local.params
+        service = model.service_model.service_name
+        if model.name == 'GetBucketLocation':
+            region = self.buckets[params['Bucket']]
+            return AWSResponse(None, 200, {}, None), {
+                'LocationConstraint': None if region == 'us-east-1' else region
+            }
+        if model.name == 'GetMetricData':
+            return AWSResponse(None, 200, {}, None), {'MetricDataResults': [
+                self.metric(query) for query in params['MetricDataQueries']
+            ]}
+        key, input_token, output_token, page_size = PAGING[(service, model.name)]
+        items = self.data.get((service, model.name))
+        if 'StackId' in params:
+            items = items.get(params['StackId'], [])
+        if model.name == 'ListObjectsV2':
+            items = self.objects[params['Bucket']]
+        if params.get('Filters'):
+            items = self.filter(service, model.name, items, params['Filters'])
+
+        start = int(params.get(input_token) or 0) if input_token else 0
+        size = params.get('MaxResults') or params.get('MaxRecords') or page_size or len(items) or 1
+        parsed = {key: items[start:start + size]}
+        if start + size < len(items):
+            parsed[output_token] = str(start + size)
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': 200}
+        return AWSResponse(None, 200, {}, None), parsed
+
+    def metric(self, query):
+        """
+        Returns the synthetic datapoints of one CloudWatch metric query
+        """
+        metric = query['MetricStat']['Metric']
+        bucket = [dimension['Value'] for dimension in metric['Dimensions'] if dimension['Name'] == 'BucketName'][0]
+        points = self.metrics.get((bucket, metric['MetricName']), [])
+        return {
+            'Id': query['Id'],
+            'Label': metric['MetricName'],
+            'Timestamps': [timestamp for timestamp, _ in points],
+            'Values': [value for _, value in points],
+            'StatusCode': 'Complete'
+        }
+
+    def filter(self, service, operation, items, filters):
+        """
+        Applies the API filters Sweeper pushes down, remembering the result so
+        paging through a filtered collection stays linear
+        """
+        key = (service, operation, repr(filters))
+        with self.lock:
+            if key in self.filtered:
+                return self.filtered[key]
+        fields = dict(
+            (name, field) for (pushed_service, pushed_operation, field), name in PUSHDOWN.items()
+            if pushed_service == service and pushed_operation == xform_name(operation)
+        )
+        for pushed in filters:
+            field = fields[pushed['Name']]
+            items = [item for item in items if item.get(field) in pushed['Values']]
+        with self.lock:
+            self.filtered[key] = items
+        return items
+
+class SyntheticPool(ClientPool):
+    """
+    Client pool whose sessions are served by a synthetic account
+    """
+    def __init__(self, account, max_connections=10):
+        super(SyntheticPool, self).__init__(max_connections)
+        self.account = account
+
+    def session(self, profile):
+        """
+        Returns a session with dummy credentials attached to the synthetic account
+        """
+        if profile not in self.sessions:
+            self.sessions[profile] = boto3.Session(
+                aws_access_key_id='benchmark',
+                aws_secret_access_key='benchmark',
+                region_name='us-east-1'
+            )
+            self.account.attach(self.sessions[profile])
+        return self.sessions[profile]
+
+def create_sweeper(workers):
+    """
+    Builds a Sweeper for the benchmark profile without running a sweep
+    """
+    config = tempfile.NamedTemporaryFile(mode='w', suffix='.yml', delete=False)
+    yaml.safe_dump({'profiles': ['benchmark']}, config)
+    config.close()
+    try:
+        sweeper = Sweeper({'-c': config.name, '-j': str(workers)}, run=False)
+    finally:
+        os.remove(config.name)
+    sweeper.regions = ['us-east-1']
+    return sweeper
+
+def run_check(sweeper, pool, check, services):
+    """
+    Runs one check against the pool's account, returning its measurements.
+    Clients and the endpoint data are loaded beforehand so neither is measured
+    """
+    sweeper.pool = pool
+    sweeper.cache = ResourceCache(sweeper.create_client)
+    sweeper.bucket_regions = {}
+    sweeper.checks_to_exclude = [name for name, _, _ in CHECKS if name != check]
+    for service in services:
+        sweeper.create_client(service, sweeper.regions[0], 'benchmark')
+    sweeper.has_endpoint('ec2', sweeper.regions[0])
+    pool.account.calls = 0
+
+    tracemalloc.start()
+    started = time.time()
+    units = list(sweeper.execute(sweeper.build_units('benchmark')))
+    wall = time.time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for unit in units:
+        if unit.failed or unit.profile_missing:
+            print('\n'.join(str(line) for line in unit.lines))
+    return {
+        'calls': pool.account.calls,
+        'wall': wall,
+        'peak': peak,
+        'findings': sum(len(unit.findings) for unit in units),
+        'failed': any(unit.failed or unit.profile_missing for unit in units)
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    Prints how each result moved against the baseline, returning the regressions
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for measure in MEASURES:
+            before = baseline[name][measure]
+            after = result[measure]
+            change = (after - before) / float(before) if before else 0.0
+            flag = ''
+            # Wall times this small are mostly noise
+            if change > tolerance and (measure != 'wall' or after - before > 0.05):
+                flag = ' REGRESSION'
+                regressions.append((name, measure))
+            print("{:<28} {:<6} {:>14.3f} -> {:>14.3f} ({:+.0%}){}".format(name, measure, before, after, change, flag))
+    return regressions
+
+def run_benchmarks(args):
+    """
+    Runs every selected check at every selected scale and reports the results
+    """
+    scales = SCALES
+    if '-s' in args:
+        scales = [(name, sizes) for name, sizes in SCALES if name in str(args['-s']).split(',')]
+    checks = [name for name, _, _ in CHECKS]
+    if '-k' in args:
+        checks = [name for name in checks if name in str(args['-k']).split(',')]
+    sweeper = create_sweeper(int(args.get('-j', 1)))
+    services = boto3.Session().get_available_services()
+
+    results = {}
+    print("{:<6} {:<18} {:>8} {:>10} {:>11} {:>9}".format('scale', 'check', 'calls', 'wall(s)', 'peak(MiB)', 'findings'))
+    for scale, sizes in scales:
+        pool = SyntheticPool(SyntheticAccount(sizes), sweeper.workers)
+        for check in checks:
+            needs = [COLLECTIONS[collection][0] for name, _, collections in CHECKS if name == check
+                     for collection in collections] or CHECK_SERVICES.get(check, [])
+            if [service for service in needs if service not in services]:
+                print("{:<6} {:<18} SKIPPED: installed botocore has no {} client".format(scale, check, needs[0]))
+                continue
+            result = run_check(sweeper, pool, check, needs)
+            results['{}/{}'.format(scale, check)] = result
+            print("{:<6} {:<18} {:>8} {:>10.3f} {:>11.2f} {:>9}{}".format(
+                scale,
+                check,
+                result['calls'],
+                result['wall'],
+                result['peak'] / 1048576.0,
+                result['findings'],
+                ' FAILED' if result['failed'] else '')
+            )
+
+    if '--save' in args:
+        with open(args['--save'], 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+        print("INFO: Results saved to {}".format(args['--save']))
+    if '--compare' in args:
+        with open(args['--compare']) as stream:
+            baseline = json.load(stream)
+        print("\nCompared with {}".format(args['--compare']))
+        regressions = compare(results, baseline, float(args.get('--tolerance', 0.25)))
+        if regressions:
+            print("ERROR: {} regressions found".format(len(regressions)))
+            sys.exit(1)
+    if any(result['failed'] for result in results.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    OPTS = {}
+    ARGS = sys.argv[1:]
+    while ARGS:
+        if ARGS[0] == '-h':
+            show_usage()
+        elif ARGS[0][0] == '-':
+            try:
+                OPTS[ARGS[0]] = ARGS[1]
+            except IndexError:
+                print("Skipping option {}: value not provided".format(ARGS[0]))
+        ARGS = ARGS[1:]
+    run_benchmarks(OPTS)
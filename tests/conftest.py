@@ -0,0 +1,89 @@
+import os.path
+import sys
+
+import boto3
+from botocore.awsrequest import AWSResponse
+import pytest
+
+# Sweeper is a single script rather than a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# An answer to describe_regions with no regions, for tests that only need a call to succeed
+REGIONS = '<DescribeRegionsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><regionInfo/></DescribeRegionsResponse>'
+
+@pytest.fixture
+def session():
+    """
+    A session with dummy credentials, so requests are signed but never need real ones
+    """
+    return boto3.Session(
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        region_name='us-east-1'
+    )
+
+class Body(object):
+    """
+    Stands in for urllib3's response, which botocore only streams the body from
+    """
+    def __init__(self, body):
+        self.body = body.encode('utf-8')
+
+    def stream(self, **kwargs):
+        yield self.body
+
+@pytest.fixture
+def respond():
+    """
+    Answers the attempts of a client, or of every client a session creates from
+    then on, without sending them. Each answer is a (status, body) pair, an
+    exception to raise, or a function of the request returning one, and the last
+    answer is repeated once they run out
+    """
+    def register(target, *answers):
+        answers = list(answers)
+
+        def send(request, **kwargs):
+            answer = answers.pop(0) if len(answers) > 1 else answers[0]
+            if callable(answer):
+                answer = answer(request)
+            if isinstance(answer, Exception):
+                raise answer
+            status, body = answer
+            return AWSResponse(request.url, status, {}, Body(body))
+        events = target.meta.events if hasattr(target, 'meta') else target.events
+        events.register('before-send', send)
+        return target
+    return register
+
+@pytest.fixture
+def pool_for(session):
+    """
+    Builds client pools over the dummy session, with the given hooks, whose
+    calls make the given number of attempts
+    """
+    from botocore.config import Config
+    from Sweeper import ClientPool
+
+    def build(hooks, attempts=1):
+        pool = ClientPool(hooks=hooks)
+        pool.config = Config(retries={'max_attempts': attempts, 'mode': 'standard'})
+        pool.sessions[None] = session
+        return pool
+    return build
+
+@pytest.fixture
+def sweeper(tmp_path, session):
+    """
+    A Sweeper for one profile, with the dummy session, that has not swept.
+    Calls are made once rather than retried
+    """
+    from botocore.config import Config
+    from Sweeper import Sweeper
+    config = tmp_path / 'config.yml'
+    config.write_text(u'profiles:\n  - test\n')
+    sweeper = Sweeper({'-c': str(config)}, run=False)
+    sweeper.regions = ['us-east-1']
+    sweeper.pool.config = Config(retries={'max_attempts': 1, 'mode': 'standard'})
+    sweeper.pool.sessions['test'] = session
+    return sweeper
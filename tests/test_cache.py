@@ -0,0 +1,39 @@
+import threading
+import time
+
+from Sweeper import ResourceCache
+
+class Volumes(object):
+    """
+    An EC2 client answering describe_volumes slowly, counting its calls
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def can_paginate(self, operation):
+        return False
+
+    def describe_volumes(self, **kwargs):
+        self.calls += 1
+        time.sleep(0.1)
+        return {'Volumes': [{'VolumeId': 'vol-1', 'State': 'available'}]}
+
+def test_planned_readers_share_one_fetch():
+    client = Volumes()
+    cache = ResourceCache(lambda service, region, profile: client)
+    for _ in range(2):
+        cache.plan('test', 'us-east-1', ['ec2-available-volumes'])
+    read = []
+
+    def reader():
+        read.append(list(cache.get('test', 'us-east-1', 'ec2-available-volumes').values('VolumeId')))
+        cache.release('test', 'us-east-1', ['ec2-available-volumes'])
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert read == [['vol-1'], ['vol-1']]
+    assert client.calls == 1
+    assert (cache.fetches, cache.hits) == (1, 1)
+    assert cache.entries == cache.readers == cache.locks == {}
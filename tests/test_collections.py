@@ -0,0 +1,60 @@
+import pytest
+
+import Sweeper
+from Sweeper import Columns, Stream
+
+FIELDS = ['SnapshotId', 'VolumeId', 'Tags[].Value', 'State.Name']
+
+def snapshots(count):
+    items = []
+    for index in range(count):
+        item = {
+            'SnapshotId': u'snap-{:06d}'.format(index),
+            'Tags': [{'Key': 'Name', 'Value': u'café-{}'.format(index)}] * (index % 3),
+            'State': {'Name': 'completed'}
+        }
+        # Some snapshots' volumes are gone, and botocore leaves missing fields out
+        if index % 3:
+            item['VolumeId'] = u'vol-{:06d}'.format(index % 7)
+        items.append(item)
+    return items
+
+@pytest.fixture(params=['memory', 'spilled'])
+def columns(request, tmp_path, monkeypatch):
+    """
+    The snapshots as Columns, held in memory or spilled to a file
+    """
+    spill = None
+    if request.param == 'spilled':
+        monkeypatch.setattr(Sweeper, 'SPILL_BYTES', 64)
+        spill = str(tmp_path)
+    held = Columns(FIELDS, snapshots(500), spill)
+    assert all((column.file is not None) == bool(spill) for column in held.columns.values())
+    yield held
+    held.close()
+
+@pytest.mark.parametrize('field', FIELDS)
+def test_columns_keys_match_the_stream(columns, field):
+    assert columns.keys(field) == Stream(snapshots(500)).keys(field)
+
+@pytest.mark.parametrize('field', ['VolumeId', 'SnapshotId'])
+def test_columns_anti_join_matches_the_stream(columns, field):
+    keys = set(u'vol-{:06d}'.format(index) for index in range(3)) | set([u'snap-000010', u'snap-000499'])
+    expected = list(Stream(snapshots(500)).anti_join(field, keys, 'SnapshotId'))
+    assert list(columns.anti_join(field, keys, 'SnapshotId')) == expected
+    assert len(expected) < 500
+
+def test_columns_round_trip_as_rows(columns):
+    rows = list(columns)
+    assert len(rows) == len(columns) == 500
+    assert rows[4] == {
+        'SnapshotId': u'snap-000004',
+        'VolumeId': u'vol-000004',
+        'Tags[].Value': [u'café-4'],
+        'State.Name': u'completed'
+    }
+    assert list(Columns(FIELDS, rows)) == rows
+
+def test_columns_hold_scalars_as_strings():
+    held = Columns(['VolumeId', 'Size', 'Encrypted'], [{'VolumeId': 'vol-1', 'Size': 8, 'Encrypted': None}])
+    assert list(held) == [{'VolumeId': 'vol-1', 'Size': '8', 'Encrypted': ''}]
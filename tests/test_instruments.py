@@ -0,0 +1,33 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+from conftest import REGIONS
+from Sweeper import Instruments, RateLimiter, RegionFinder
+
+def unreachable(pool, respond):
+    respond(pool.client('ec2', 'us-east-1'), EndpointConnectionError(endpoint_url='https://ec2.us-east-1.amazonaws.com'))
+    return pool
+
+def test_failing_call_is_recorded_as_an_error(pool_for, respond):
+    instruments = Instruments()
+    client = unreachable(pool_for([instruments]), respond).client('ec2', 'us-east-1')
+    with pytest.raises(EndpointConnectionError):
+        client.describe_regions()
+    calls, errors, _, size = instruments.operations[('ec2', 'DescribeRegions')]
+    assert (calls, errors, size) == (1, 1, 0)
+    assert 'DescribeRegions: 1 calls, 1 errors' in '\n'.join(instruments.report())
+
+def test_unreachable_region_discovery_falls_back(pool_for, respond, tmp_path):
+    finder = RegionFinder(unreachable(pool_for([Instruments()]), respond), str(tmp_path / 'regions.json'))
+    assert finder.regions(None) is None
+
+def test_rate_limiter_waits_are_not_latency(pool_for, respond):
+    limiter = RateLimiter(rate=10.0)
+    instruments = Instruments()
+    client = respond(pool_for([limiter, instruments]).client('ec2', 'us-east-1'), (200, REGIONS))
+    for _ in range(15):
+        client.describe_regions()
+    calls, errors, seconds, _ = instruments.operations[('ec2', 'DescribeRegions')]
+    assert (calls, errors) == (15, 0)
+    assert limiter.waited >= 0.4
+    assert seconds < limiter.waited / 4
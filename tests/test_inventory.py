@@ -0,0 +1,23 @@
+import Sweeper
+from Sweeper import Columns, Inventory
+
+FIELDS = ['VolumeId', 'Tags[].Value']
+
+def volumes(count):
+    return [{'VolumeId': u'vol-{:04d}'.format(index), 'Tags[].Value': [u'café'] * (index % 2)} for index in range(count)]
+
+def test_collections_round_trip_an_item_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(Sweeper, 'INVENTORY_BATCH', 3)
+    inventory = Inventory(str(tmp_path / 'sweeper.db'), ttl=60)
+    inventory.save('test', 'us-east-1', 'ec2-available-volumes', Columns(FIELDS, volumes(10)))
+    items = inventory.load('test', 'us-east-1', 'ec2-available-volumes')
+    # Read lazily, in batches, rather than returned as a list
+    assert not isinstance(items, list)
+    assert list(Columns(FIELDS, items)) == volumes(10)
+
+def test_saving_replaces_the_stored_collection(tmp_path):
+    inventory = Inventory(str(tmp_path / 'sweeper.db'), ttl=60)
+    inventory.save('test', 'us-east-1', 'ec2-available-volumes', volumes(5))
+    inventory.save('test', 'us-east-1', 'ec2-available-volumes', volumes(2))
+    assert list(inventory.load('test', 'us-east-1', 'ec2-available-volumes')) == volumes(2)
+    assert inventory.load('test', 'eu-west-1', 'ec2-available-volumes') is None
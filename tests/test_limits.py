@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from conftest import REGIONS
+from Sweeper import OutOfTime, RateLimiter, TimeBudget
+
+THROTTLED = '<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Slow down</Message></Error></Errors></Response>'
+
+def test_retries_stop_at_the_deadline(pool_for, respond):
+    budget = TimeBudget()
+    client = respond(pool_for([RateLimiter(), budget], attempts=10).client('ec2', 'us-east-1'), (503, THROTTLED))
+    budget.deadline = time.time() + 0.2
+    started = time.time()
+    with pytest.raises(OutOfTime):
+        client.describe_regions()
+    # Without the deadline, ten attempts back off for up to 20s each
+    assert time.time() - started < 3.5
+
+def test_rate_limiter_does_not_wait_past_the_deadline(pool_for, respond):
+    budget = TimeBudget()
+    client = respond(pool_for([RateLimiter(rate=1.0, budget=budget), budget]).client('ec2', 'us-east-1'), (200, REGIONS))
+    client.describe_regions()
+    budget.deadline = time.time() + 0.2
+    started = time.time()
+    with pytest.raises(OutOfTime):
+        client.describe_regions()
+    assert time.time() - started < 0.6
+
+def test_throttle_halves_the_rate(pool_for, respond):
+    limiter = RateLimiter(rate=10.0)
+    client = respond(pool_for([limiter, TimeBudget()], attempts=2).client('ec2', 'us-east-1'), (503, THROTTLED), (200, REGIONS))
+    client.describe_regions()
+    rate, _, _ = limiter.buckets[(None, 'ec2', 'us-east-1')]
+    assert limiter.throttles == 1
+    # Halved by the throttle, then won a little back by the retry that worked
+    assert rate == pytest.approx(5.1)
+
+@pytest.mark.parametrize('rate', ['0', '-5'])
+def test_rate_must_be_positive(sweeper, rate):
+    with pytest.raises(SystemExit):
+        sweeper.set_workers({'--rate': rate})
+
+@pytest.mark.parametrize('budget', ['0', '-5'])
+def test_time_budget_must_be_positive(sweeper, budget):
+    with pytest.raises(SystemExit):
+        sweeper.set_workers({'--time-budget': budget})
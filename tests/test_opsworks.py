@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+from Sweeper import OPSWORKS_QUERIES
+
+STACKS = ['stack-{}'.format(index) for index in range(8)]
+
+class Stacks(object):
+    """
+    An Opsworks client whose stack number n has n + i resources of the i-th
+    OPSWORKS_QUERIES, answering slowly while keeping track of how many calls
+    are in flight at once. A stack in failing has its calls refused
+    """
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.lock = threading.Lock()
+        self.active = 0
+        self.most_active = 0
+        self.calls = 0
+
+    def can_paginate(self, operation):
+        return False
+
+    def __getattr__(self, operation):
+        index = [name for name, _, _ in OPSWORKS_QUERIES].index(operation)
+
+        def call(StackId):
+            with self.lock:
+                self.calls += 1
+                self.active += 1
+                self.most_active = max(self.most_active, self.active)
+            try:
+                time.sleep(0.02)
+                if StackId in self.failing:
+                    raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, operation)
+                return {OPSWORKS_QUERIES[index][1]: [None] * (STACKS.index(StackId) + index)}
+            finally:
+                with self.lock:
+                    self.active -= 1
+        return call
+
+@pytest.fixture(params=[1, 3])
+def stack_workers(request, sweeper):
+    """
+    Sweeps stacks one query at a time, or with three stack workers
+    """
+    if request.param > 1:
+        sweeper.stack_executor = ThreadPoolExecutor(max_workers=request.param)
+    yield request.param
+    if sweeper.stack_executor:
+        sweeper.stack_executor.shutdown(wait=True)
+
+def test_stacks_are_counted_in_order(sweeper, stack_workers):
+    client = Stacks()
+    counted = list(sweeper.count_stack_resources(client, STACKS))
+    assert counted == [
+        (stack_id, [stack + index for index in range(len(OPSWORKS_QUERIES))])
+        for stack, stack_id in enumerate(STACKS)
+    ]
+    assert client.most_active <= stack_workers
+    assert client.calls == len(STACKS) * len(OPSWORKS_QUERIES)
+
+def test_a_refused_query_cancels_the_rest(sweeper):
+    sweeper.stack_executor = ThreadPoolExecutor(max_workers=2)
+    client = Stacks(failing=[STACKS[0]])
+    with pytest.raises(ClientError):
+        list(sweeper.count_stack_resources(client, STACKS))
+    sweeper.stack_executor.shutdown(wait=True)
+    # Only the queries already running when the first one failed were made
+    assert client.calls < len(OPSWORKS_QUERIES)
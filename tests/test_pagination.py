@@ -0,0 +1,28 @@
+import pytest
+
+from Sweeper import paginate
+
+class Pages(object):
+    """
+    A client whose operation has no paginator, answering from a list of pages
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def can_paginate(self, operation):
+        return False
+
+    def describe_things(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.pages[len(self.calls) - 1]
+
+@pytest.mark.parametrize('token', ['NextToken', 'Marker'])
+def test_paginate_follows_tokens_by_hand(token):
+    client = Pages([
+        {'Things': [1, 2], token: 'second'},
+        {'Things': [3], token: 'third'},
+        {'Things': [], token: ''}
+    ])
+    assert list(paginate(client, 'describe_things', 'Things', Limit=2)) == [1, 2, 3]
+    assert client.calls == [{'Limit': 2}, {'Limit': 2, token: 'second'}, {'Limit': 2, token: 'third'}]
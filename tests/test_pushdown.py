@@ -0,0 +1,34 @@
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+VOLUMES = '<DescribeVolumesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><volumeSet/></DescribeVolumesResponse>'
+ADDRESSES = '''<DescribeAddressesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><addressesSet>
+<item><publicIp>203.0.113.7</publicIp><allocationId>eipalloc-1</allocationId><domain>vpc</domain></item>
+<item><publicIp>203.0.113.8</publicIp><allocationId>eipalloc-2</allocationId><domain>vpc</domain><instanceId>i-1</instanceId></item>
+</addressesSet></DescribeAddressesResponse>'''
+
+def capture(sent, body):
+    """
+    Answers with the body, keeping the parameters of each request
+    """
+    def answer(request):
+        data = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+        sent.append(dict((name, values[0]) for name, values in parse_qs(data).items()))
+        return (200, body)
+    return answer
+
+def test_volume_state_is_filtered_by_the_api(sweeper, respond, session):
+    sent = []
+    respond(session, capture(sent, VOLUMES))
+    assert list(sweeper.cache.stream('test', 'us-east-1', 'ec2-available-volumes')) == []
+    assert sent[0]['Filter.1.Name'] == 'status'
+    assert sent[0]['Filter.1.Value.1'] == 'available'
+
+def test_associated_addresses_are_dropped_in_python(sweeper, respond, session):
+    sent = []
+    respond(session, capture(sent, ADDRESSES))
+    addresses = list(sweeper.cache.stream('test', 'us-east-1', 'ec2-unassociated-addresses'))
+    assert [address['PublicIp'] for address in addresses] == ['203.0.113.7']
+    assert not any(name.startswith('Filter') for name in sent[0])
@@ -0,0 +1,55 @@
+import time
+
+import boto3
+
+from Sweeper import RegionFinder
+
+REGIONS = '''<DescribeRegionsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><regionInfo>
+<item><regionName>eu-west-1</regionName><optInStatus>opt-in-not-required</optInStatus></item>
+<item><regionName>us-east-1</regionName><optInStatus>opt-in-not-required</optInStatus></item>
+<item><regionName>af-south-1</regionName><optInStatus>not-opted-in</optInStatus></item>
+</regionInfo></DescribeRegionsResponse>'''
+ZONES = '<DescribeAvailabilityZonesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><availabilityZoneInfo/></DescribeAvailabilityZonesResponse>'
+
+def slowly(request):
+    """
+    Answers region discovery and pre-flight calls after a round trip's delay
+    """
+    time.sleep(0.5)
+    body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+    return (200, REGIONS if 'DescribeRegions' in body else ZONES)
+
+def account(respond):
+    return respond(boto3.Session(aws_access_key_id='testing', aws_secret_access_key='testing'), slowly)
+
+def test_profiles_are_discovered_concurrently(sweeper, respond, tmp_path):
+    profiles = ['a', 'b', 'c', 'd']
+    for profile in profiles:
+        sweeper.pool.sessions[profile] = account(respond)
+        # Loads the service model up front, so only the calls are timed
+        sweeper.pool.client('ec2', 'us-east-1', profile)
+    sweeper.region_finder = RegionFinder(sweeper.pool, str(tmp_path / 'regions.json'))
+    sweeper.workers = 4
+    started = time.time()
+    plan = sweeper.plan(profiles, ['ebs-volumes'])
+    # One profile at a time takes a second each
+    assert time.time() - started < 2.5
+    assert [profile for profile, _ in plan] == profiles
+    assert all([unit.region for unit in units] == ['eu-west-1', 'us-east-1'] for _, units in plan)
+
+def test_preflight_clients_are_kept_between_sweeps(sweeper, respond, tmp_path):
+    sweeper.pool.sessions['a'] = account(respond)
+    finder = RegionFinder(sweeper.pool, str(tmp_path / 'regions.json'))
+    assert finder.regions('a') == ['eu-west-1', 'us-east-1']
+    clients = dict(sweeper.pool.clients)
+    finder.reset()
+    assert finder.regions('a') == ['eu-west-1', 'us-east-1']
+    assert sweeper.pool.clients == clients
+    # describe_regions' client, and a pre-flight client for each enabled region
+    assert len(clients) == 3
+
+def test_preflight_calls_are_instrumented(sweeper, respond, tmp_path):
+    sweeper.pool.sessions['a'] = account(respond)
+    finder = RegionFinder(sweeper.pool, str(tmp_path / 'regions.json'))
+    finder.regions('a')
+    assert sweeper.instruments.operations[('ec2', 'DescribeAvailabilityZones')][0] == 2
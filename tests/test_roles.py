@@ -0,0 +1,40 @@
+import datetime
+
+import pytest
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
+
+import Sweeper
+from Sweeper import RoleCredentials
+
+def assume(account):
+    expiry = datetime.datetime.now(tzutc()) + datetime.timedelta(hours=1)
+    return {'access_key': account, 'secret_key': 'secret', 'token': 'token', 'expiry_time': expiry.isoformat()}
+
+def deny(account):
+    raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, 'AssumeRole')
+
+def test_accounts_share_the_management_loader(session):
+    roles = RoleCredentials(session, 'Sweeper')
+    roles.assume = assume
+    loader = session._session.get_component('data_loader')
+    paths = list(loader.search_paths)
+    sessions = [roles.session(account) for account in ('111111111111', '222222222222')]
+    assert all(account._session.get_component('data_loader') is loader for account in sessions)
+    assert loader.search_paths == paths
+    assert sessions[0].get_credentials().access_key == '111111111111'
+
+def test_failed_role_is_retried_after_a_while(session, monkeypatch):
+    roles = RoleCredentials(session, 'Sweeper')
+    calls = []
+    roles.assume = lambda account: calls.append(account) or deny(account)
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            roles.session('111111111111')
+    assert len(calls) == 1
+    monkeypatch.setattr(Sweeper, 'ROLE_RETRY_SECONDS', -1)
+    with pytest.raises(ClientError):
+        roles.session('222222222222')
+    with pytest.raises(ClientError):
+        roles.session('222222222222')
+    assert len(calls) == 3
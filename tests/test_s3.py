@@ -0,0 +1,131 @@
+import json
+import time
+
+import Sweeper
+from Sweeper import SweepUnit
+
+DAY = 86400
+CREATED = '2020-01-01T00:00:00.000Z'
+OLD = '2020-06-01T00:00:00.000Z'
+DENIED = '<Error><Code>AccessDenied</Code><Message>Access Denied</Message></Error>'
+
+def bucket_list(buckets):
+    """
+    A ListBuckets response for (name, region) pairs, leaving out regions that are None
+    """
+    return '<ListAllMyBucketsResult><Buckets>{}</Buckets></ListAllMyBucketsResult>'.format(''.join(
+        '<Bucket><Name>{}</Name><CreationDate>{}</CreationDate>{}</Bucket>'.format(
+            name, CREATED, '<BucketRegion>{}</BucketRegion>'.format(region) if region else '')
+        for name, region in buckets
+    ))
+
+def object_list(dates, truncated=False):
+    """
+    A ListObjectsV2 page holding an object last modified at each date
+    """
+    return '<ListBucketResult><IsTruncated>{}</IsTruncated>{}{}</ListBucketResult>'.format(
+        'true' if truncated else 'false',
+        ''.join('<Contents><Key>k{}</Key><LastModified>{}</LastModified></Contents>'.format(i, date)
+                for i, date in enumerate(dates)),
+        '<NextContinuationToken>more</NextContinuationToken>' if truncated else ''
+    )
+
+class Account(object):
+    """
+    Answers an account's S3 and CloudWatch calls, keeping the URL of each.
+    requests and objects map bucket names to their metric values, oldest first,
+    and listings map them to the ListObjectsV2 pages they answer in turn
+    """
+    def __init__(self, buckets, requests=None, objects=None, listings=None):
+        self.buckets = buckets
+        self.requests = requests or {}
+        self.objects = objects or {}
+        self.listings = listings or {}
+        self.urls = []
+
+    def __call__(self, request):
+        self.urls.append(request.url)
+        if 'monitoring.' in request.url:
+            return (200, json.dumps({'MetricDataResults': [
+                self.metric(query) for query in json.loads(request.body)['MetricDataQueries']
+            ]}))
+        if '?location' in request.url:
+            return (403, DENIED)
+        if 'list-type=2' in request.url:
+            name = request.url.split('//')[1].split('.')[0]
+            return (200, self.listings[name].pop(0))
+        return (200, bucket_list(self.buckets))
+
+    def metric(self, query):
+        name = query['MetricStat']['Metric']['Dimensions'][0]['Value']
+        series = (self.requests if query['Id'].startswith('r') else self.objects).get(name, [])
+        # A day apart, the first the day after the cutoff
+        start = time.time() - 89 * DAY
+        return {
+            'Id': query['Id'],
+            'Timestamps': [start + day * DAY for day in range(len(series))],
+            'Values': series
+        }
+
+def sweep_s3(sweeper, respond, session, account, region='us-east-1'):
+    respond(session, account)
+    return sweeper.run_unit(SweepUnit('test', region, 's3', sweeper.check_s3_buckets, []))
+
+def reasons(unit):
+    return dict((finding.resource_id, finding.reason) for finding in unit.findings)
+
+def test_request_metrics_decide_whether_a_bucket_is_idle(sweeper, respond, session):
+    account = Account([('quiet', 'us-east-1'), ('busy', 'us-east-1')], requests={'quiet': [0.0], 'busy': [0.0, 4.0]})
+    unit = sweep_s3(sweeper, respond, session, account)
+    assert reasons(unit) == {'quiet': 'has had no requests in 90 days'}
+    assert not any('list-type=2' in url for url in account.urls)
+
+def test_object_counts_find_empty_and_unchanged_buckets(sweeper, respond, session):
+    account = Account(
+        [('empty', 'us-east-1'), ('same', 'us-east-1'), ('growing', 'us-east-1')],
+        objects={'empty': [3.0, 0.0], 'same': [7.0, 7.0, 7.0], 'growing': [7.0, 8.0]}
+    )
+    unit = sweep_s3(sweeper, respond, session, account)
+    assert reasons(unit) == {
+        'empty': 'is empty',
+        'same': 'has had the same number of objects for 90 days'
+    }
+
+def test_buckets_without_metrics_are_listed_until_a_recent_object(sweeper, respond, session):
+    recent = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+    account = Account([('fresh', 'us-east-1'), ('stale', 'us-east-1'), ('bare', 'us-east-1')], listings={
+        'fresh': [object_list([OLD, recent], truncated=True), object_list([OLD])],
+        'stale': [object_list([OLD, OLD], truncated=True), object_list([OLD])],
+        'bare': [object_list([])]
+    })
+    unit = sweep_s3(sweeper, respond, session, account)
+    assert reasons(unit) == {'stale': 'has not been written to in 90 days', 'bare': 'is empty'}
+    # The recent object ends the listing before its second page
+    assert len(account.listings['fresh']) == 1
+    assert account.listings['stale'] == []
+
+def test_listing_stops_at_the_limit(sweeper, respond, session, monkeypatch):
+    monkeypatch.setattr(Sweeper, 'S3_LIST_LIMIT', 2)
+    account = Account([('huge', 'us-east-1')], listings={'huge': [object_list([OLD, OLD, OLD])]})
+    unit = sweep_s3(sweeper, respond, session, account)
+    assert unit.findings == []
+    assert 'Bucket huge has no CloudWatch metrics and too many objects to list' in unit.lines
+
+def test_buckets_that_cannot_be_located_are_reported_from_us_east_1(sweeper, respond, session):
+    account = Account([('placed', 'us-east-1'), ('lost', None)], requests={'placed': [1.0]})
+    unit = sweep_s3(sweeper, respond, session, account)
+    assert 'Could not determine the region of 1 buckets: lost' in unit.lines
+    assert not unit.failed
+    # Each concurrent lookup has a connection of its own
+    client = sweeper.pool.client('s3', 'us-east-1', 'test', Sweeper.S3_LOCATION_CONFIG)
+    assert client.meta.config.max_pool_connections == Sweeper.S3_LOCATION_WORKERS
+
+def test_failed_bucket_listing_is_not_repeated(sweeper, respond, session):
+    urls = []
+    respond(session, lambda request: urls.append(request.url) or (403, DENIED))
+    units = [
+        sweeper.run_unit(SweepUnit('test', region, 's3', sweeper.check_s3_buckets, []))
+        for region in ['us-east-1', 'eu-west-1']
+    ]
+    assert all(unit.failed for unit in units)
+    assert len(urls) == 1
@@ -0,0 +1,38 @@
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from Sweeper import SweepUnit
+
+IMAGES = '''<DescribeImagesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><imagesSet>
+<item><imageId>ami-1</imageId><imageState>available</imageState><blockDeviceMapping>
+<item><deviceName>/dev/xvda</deviceName><ebs><snapshotId>snap-used</snapshotId></ebs></item>
+<item><deviceName>/dev/xvdb</deviceName><ebs><snapshotId>snap-also-used</snapshotId></ebs></item>
+</blockDeviceMapping></item>
+</imagesSet></DescribeImagesResponse>'''
+SNAPSHOTS = '''<DescribeSnapshotsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><snapshotSet>
+<item><snapshotId>snap-used</snapshotId><status>completed</status></item>
+<item><snapshotId>snap-orphan</snapshotId><status>completed</status></item>
+<item><snapshotId>snap-also-used</snapshotId><status>completed</status></item>
+<item><snapshotId>snap-lost</snapshotId><status>completed</status></item>
+</snapshotSet></DescribeSnapshotsResponse>'''
+
+def test_snapshots_not_used_by_an_ami_are_found(sweeper, respond, session):
+    sent = {}
+
+    def answer(request):
+        data = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+        params = dict((name, values[0]) for name, values in parse_qs(data).items())
+        sent[params['Action']] = params
+        return (200, IMAGES if params['Action'] == 'DescribeImages' else SNAPSHOTS)
+    respond(session, answer)
+    unit = sweeper.run_unit(SweepUnit('test', 'us-east-1', 'ebs-snapshots', sweeper.check_snapshots,
+                                      ['ec2-images', 'ec2-snapshots']))
+    assert not unit.failed
+    assert sent['DescribeImages']['Owner.1'] == 'self'
+    assert (sent['DescribeImages']['Filter.1.Name'], sent['DescribeImages']['Filter.1.Value.1']) == ('state', 'available')
+    assert sent['DescribeSnapshots']['Owner.1'] == 'self'
+    assert (sent['DescribeSnapshots']['Filter.1.Name'], sent['DescribeSnapshots']['Filter.1.Value.1']) == ('status', 'completed')
+    assert [finding.resource_id for finding in unit.findings] == ['snap-orphan', 'snap-lost']
+    assert 'There are 2 snapshots to remove' in unit.lines
@@ -0,0 +1,117 @@
+import json
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, HTTPError
+
+from botocore.exceptions import EndpointConnectionError
+import pytest
+
+from Sweeper import CsvSink, Finding, Inventory, JsonLinesSink, MemorySink, SweepUnit
+
+def test_unreachable_endpoint_fails_only_its_unit(sweeper, respond):
+    respond(sweeper.pool.client('ec2', 'us-east-1', 'test'), EndpointConnectionError(endpoint_url='https://ec2.us-east-1.amazonaws.com'))
+    unit = sweeper.run_unit(SweepUnit('test', 'us-east-1', 'ebs-volumes', sweeper.check_ebs_volumes, ['ec2-available-volumes']))
+    assert unit.failed
+    assert any('could not be reached' in str(line) for line in unit.lines)
+
+def test_checks_are_not_built_where_their_service_has_no_endpoint(sweeper, monkeypatch):
+    monkeypatch.setattr(sweeper, 'endpoints', {
+        'ec2': set(['us-east-1', 'mx-central-1']),
+        'elasticbeanstalk': set(['us-east-1'])
+    })
+    sweeper.regions = ['us-east-1', 'mx-central-1']
+    units = set((unit.region, unit.check) for unit in sweeper.build_units('test'))
+    assert ('us-east-1', 'elastic-beanstalk') in units
+    assert ('mx-central-1', 'elastic-beanstalk') not in units
+    assert ('mx-central-1', 'ebs-volumes') in units
+
+ADDRESSES = '<DescribeAddressesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><addressesSet/></DescribeAddressesResponse>'
+
+def test_daemon_writes_metrics_after_every_sweep(sweeper, respond, session, tmp_path):
+    respond(session, (200, ADDRESSES))
+    sweeper.daemon = True
+    sweeper.prometheus = str(tmp_path / 'sweeper.prom')
+    sweeper.sweep(['test'], ['ec2-eips'])
+    assert 'DescribeAddresses' in (tmp_path / 'sweeper.prom').read_text()
+    (tmp_path / 'sweeper.prom').unlink()
+    sweeper.sweep(['test'], ['ec2-eips'])
+    assert (tmp_path / 'sweeper.prom').exists()
+
+@pytest.mark.parametrize('query', ['checks=ec2-eips,nope', 'profiles=test,stranger'])
+def test_sweep_endpoint_rejects_unknown_names(sweeper, query):
+    server = sweeper.listen('127.0.0.1:0')
+    try:
+        with pytest.raises(HTTPError) as raised:
+            urlopen('http://127.0.0.1:{}/sweep?{}'.format(server.server_address[1], query))
+    finally:
+        server.shutdown()
+    assert raised.value.code == 400
+    assert json.loads(raised.value.read().decode('utf-8')) == {
+        'error': 'Unknown profiles or checks: {}'.format(query.split(',')[-1])
+    }
+    assert sweeper.sweeps == 0
+
+class Lines(MemorySink):
+    """
+    Keeps the report text as well as the findings
+    """
+    def __init__(self):
+        MemorySink.__init__(self)
+        self.lines = []
+
+    def line(self, string):
+        self.lines.append(string)
+
+def test_since_last_reports_new_and_resolved_findings(sweeper, tmp_path):
+    sweeper.inventory = Inventory(str(tmp_path / 'sweeper.db'))
+    sweeper.inventory.save_findings('test', 'us-east-1', 'ec2-eips', [
+        Finding('test', 'us-east-1', 'ec2-eips', 'eipalloc-1', 'is not associated', 'current'),
+        Finding('test', 'us-east-1', 'ec2-eips', 'eipalloc-2', 'is not associated', 'current')
+    ])
+    unit = SweepUnit('test', 'us-east-1', 'ec2-eips', None, [])
+    unit.record('eipalloc-2', 'is not associated')
+    unit.record('eipalloc-3', 'is not associated')
+    sink = Lines()
+    sweeper.sinks = [sink]
+    sweeper.report_changes(unit)
+    assert [(finding['resource_id'], finding['status']) for finding in sink.findings] == [
+        ('eipalloc-3', 'new'),
+        ('eipalloc-1', 'resolved')
+    ]
+    assert sink.lines == [
+        '\nec2-eips in us-east-1: 1 new and 1 resolved since the last sweep',
+        'NEW: eipalloc-3 is not associated',
+        'RESOLVED: eipalloc-1 is not associated'
+    ]
+
+UNASSOCIATED = '''<DescribeAddressesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><addressesSet>
+<item><publicIp>203.0.113.7</publicIp><allocationId>eipalloc-1</allocationId><domain>vpc</domain></item>
+</addressesSet></DescribeAddressesResponse>'''
+
+def test_findings_reach_the_file_before_the_sweep_ends(sweeper, respond, session, tmp_path):
+    respond(session, (200, UNASSOCIATED))
+    sweeper.sinks = [JsonLinesSink(str(tmp_path / 'findings.jsonl'))]
+    sweeper.sweep(['test'], ['ec2-eips'])
+    # The sink is still open, as if the process had been killed here
+    assert '203.0.113.7' in (tmp_path / 'findings.jsonl').read_text()
+
+def test_csv_sink_writes_a_header_and_a_row_per_finding(tmp_path):
+    sink = CsvSink(str(tmp_path / 'findings.csv'))
+    sink.line('Not part of the findings')
+    sink.finding(Finding('test', 'us-east-1', 'ec2-eips', '203.0.113.7', 'is not associated', 'current'))
+    sink.close()
+    assert (tmp_path / 'findings.csv').read_text() == (
+        'profile,region,check,resource_id,reason,status\n'
+        'test,us-east-1,ec2-eips,203.0.113.7,is not associated,current\n'
+    )
+
+def test_only_collecting_sweeps_keep_findings_in_memory(sweeper, respond, session, monkeypatch):
+    kept = []
+    monkeypatch.setattr(MemorySink, 'finding', lambda self, finding: kept.append(finding))
+    respond(session, (200, UNASSOCIATED))
+    assert sweeper.sweep(['test'], ['ec2-eips'])['findings'] == []
+    assert kept == []
+    sweeper.sweep(['test'], ['ec2-eips'], collect=True)
+    assert [finding.resource_id for finding in kept] == ['203.0.113.7']